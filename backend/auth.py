@@ -1,15 +1,23 @@
+import asyncio
+import multiprocessing
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
 
 import models
-from database import get_db
+from cache import TTLCache
+from database import get_async_db, get_db
 
 # Security Configuration
 # Load from environment with secure defaults
@@ -30,8 +38,37 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(
 )
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Worker processes are started from a clean server process rather than forked
+# from the (multithreaded) app, which can deadlock on locks held by other threads
+WORKER_START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
 security = HTTPBearer()
 
+# Resolved users keyed by token subject (email). Saves the user lookup on every
+# authenticated request; entries are dropped by invalidate_cached_user() when
+# a profile changes and otherwise expire after USER_CACHE_TTL_SECONDS.
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("USER_CACHE_TTL_SECONDS", "60")),
+)
+
+# Columns copied into the cache (hashed_password is deliberately left out and
+# loads from the database on access if a handler ever needs it; so do the
+# counters and versions, which change without invalidating the cache)
+_CACHED_USER_FIELDS = (
+    "id",
+    "email",
+    "username",
+    "display_name",
+    "bio",
+    "profile_picture",
+    "theme",
+    "text_density",
+    "created_at",
+)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -41,6 +78,114 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+class PasswordHasherPool:
+    """
+    Runs bcrypt work in a dedicated, size-limited process pool.
+
+    Each bcrypt call costs ~200 ms of CPU. Running it inline ties up a slot in
+    the request threadpool, so a burst of logins starves unrelated requests.
+    Here the work happens in ``max_workers`` separate processes, and once
+    ``max_pending`` calls are queued or running, new calls are rejected with
+    503 instead of letting latency grow without bound. If a worker dies, the
+    calls it broke also get a 503 and the next call starts a new pool.
+
+    ``max_workers=0`` runs bcrypt in the request threadpool (still bounded by
+    ``max_pending``), for platforms where subprocesses are unavailable.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def run(self, func, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise self._busy()
+            self._pending += 1
+        if self.max_workers <= 0:
+            # The threadpool is not abandoned on cancellation, so this returns
+            # only once the work is done
+            try:
+                return await run_in_threadpool(func, *args)
+            finally:
+                self._release()
+        executor = self._get_executor()
+        try:
+            future = executor.submit(func, *args)
+        except BaseException as exc:
+            self._release()
+            if isinstance(exc, BrokenProcessPool):
+                self._discard(executor)
+                raise self._busy() from exc
+            raise
+        # Released when the job finishes (or is cancelled before starting), not
+        # when the awaiting request goes away while it still runs
+        future.add_done_callback(lambda _: self._release())
+        try:
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool as exc:
+            # A worker died (OOM, killed); the next call starts a fresh pool
+            self._discard(executor)
+            raise self._busy() from exc
+
+    @staticmethod
+    def _busy() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    def _release(self) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(WORKER_START_METHOD),
+                )
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+password_pool = PasswordHasherPool(
+    max_workers=PASSWORD_HASH_WORKERS,
+    max_pending=int(
+        os.getenv("PASSWORD_HASH_MAX_PENDING", str(max(1, PASSWORD_HASH_WORKERS) * 8))
+    ),
+)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """``verify_password`` on the bcrypt pool (503 when saturated)"""
+    return await password_pool.run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """``get_password_hash`` on the bcrypt pool (503 when saturated)"""
+    return await password_pool.run(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -64,16 +209,11 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
+    email = _token_subject(credentials)
+    if email is None:
         raise credentials_exception
 
-    user = db.query(models.User).filter(models.User.email == email).first()
+    user = _resolve_user(db, email)
     if user is None:
         raise credentials_exception
 
@@ -87,17 +227,79 @@ def get_optional_user(
     db: Session = Depends(get_db),
 ) -> Optional[models.User]:
     """Get current user if authenticated, otherwise return None"""
-    if not credentials:
+    email = _token_subject(credentials)
+    if email is None:
         return None
 
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
+    return _resolve_user(db, email)
 
-        user = db.query(models.User).filter(models.User.email == email).first()
-        return user
+
+async def get_current_user_async(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db),
+) -> models.User:
+    """``get_current_user`` for handlers running on the async engine"""
+    email = _token_subject(credentials)
+    user = await db.run_sync(_resolve_user, email) if email else None
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+
+async def get_optional_user_async(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(
+        HTTPBearer(auto_error=False)
+    ),
+    db: AsyncSession = Depends(get_async_db),
+) -> Optional[models.User]:
+    """``get_optional_user`` for handlers running on the async engine"""
+    email = _token_subject(credentials)
+    if email is None:
+        return None
+    return await db.run_sync(_resolve_user, email)
+
+
+def _token_subject(
+    credentials: Optional[HTTPAuthorizationCredentials],
+) -> Optional[str]:
+    """Return the email in a valid bearer token, or None"""
+    if not credentials:
+        return None
+    try:
+        payload = jwt.decode(
+            credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM]
+        )
     except JWTError:
         return None
+    return payload.get("sub")
+
+
+def invalidate_cached_user(email: str) -> None:
+    """Drop a cached user; call after changing or deleting the account"""
+    user_cache.invalidate(email)
+
+
+def _resolve_user(db: Session, email: str) -> Optional[models.User]:
+    """Look up the user for a token subject, using the cache when possible"""
+    fields = user_cache.get(email)
+    if fields is not None:
+        # Prefer an instance the session already holds; otherwise attach the
+        # cached row without a SELECT
+        key = db.identity_key(models.User, fields["id"])
+        user = db.identity_map.get(key)
+        if user is None:
+            user = models.User(**fields)
+            make_transient_to_detached(user)
+            user = db.merge(user, load=False)
+        return user
+
+    user = db.query(models.User).filter(models.User.email == email).first()
+    if user is not None:
+        user_cache.set(
+            email, {field: getattr(user, field) for field in _CACHED_USER_FIELDS}
+        )
+    return user
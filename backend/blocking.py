@@ -0,0 +1,66 @@
+"""
+Cached blocked-user sets.
+
+Feed, profile and post filtering need every user a viewer blocks or is
+blocked by. The set comes from one query over the ``blocks`` table (both
+directions) and is cached per user along with ``users.blocks_version``.
+Adding or removing a block bumps that version on both users (see
+``models.py``), so a cached set is reused only while its version is still
+current. Checking the version is a primary-key lookup, which keeps every
+worker's cache correct without cross-process invalidation.
+
+List queries exclude blocked authors in SQL instead, with ``not_blocked``.
+"""
+
+import os
+from typing import FrozenSet
+
+from sqlalchemy import exists, select, union
+from sqlalchemy.orm import Session
+
+import models
+from cache import TTLCache
+
+# Entries are validated by version; the TTL only bounds memory held for
+# inactive users
+blocked_ids_cache = TTLCache(
+    maxsize=int(os.getenv("BLOCKED_IDS_CACHE_SIZE", "10000")), ttl=600
+)
+
+
+def blocked_user_ids(db: Session, user_id: int) -> FrozenSet[int]:
+    """IDs of users ``user_id`` blocks or is blocked by"""
+    version = db.execute(
+        select(models.User.blocks_version).where(models.User.id == user_id)
+    ).scalar()
+    cached = blocked_ids_cache.get(user_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    blocks = models.blocks
+    ids = frozenset(
+        db.scalars(
+            union(
+                select(blocks.c.blocked_id).where(blocks.c.blocker_id == user_id),
+                select(blocks.c.blocker_id).where(blocks.c.blocked_id == user_id),
+            )
+        )
+    )
+    blocked_ids_cache.set(user_id, (version, ids))
+    return ids
+
+
+def not_blocked(viewer_id: int, author_id_column):
+    """
+    SQL condition: no block between ``viewer_id`` and ``author_id_column``.
+
+    Two ``NOT EXISTS`` anti-joins, one per direction, each answered by an
+    index on ``blocks``. Unlike ``NOT IN (<ids>)`` the statement does not
+    grow with the number of blocks.
+    """
+    blocks = models.blocks
+    return ~exists().where(
+        blocks.c.blocker_id == viewer_id, blocks.c.blocked_id == author_id_column
+    ) & ~exists().where(
+        blocks.c.blocker_id == author_id_column, blocks.c.blocked_id == viewer_id
+    )
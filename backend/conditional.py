@@ -0,0 +1,109 @@
+"""
+Conditional GETs (ETag / If-None-Match) for feeds and profiles.
+
+Validators are derived from the ``version`` columns on posts and users (see
+``models.py``) with one aggregate query, so a client polling an unchanged
+page gets ``304 Not Modified`` before any hydration happens.
+
+ETags are weak: they identify the content, not the exact bytes, which also
+differ per ``Content-Encoding``.
+"""
+
+import hashlib
+from typing import List, Optional
+
+from fastapi import Response
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+import models
+
+# Tells browsers to revalidate (cheaply) instead of reusing a stale page
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag over ``parts`` (anything with a stable ``repr``)"""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of ``etag`` against an ``If-None-Match`` header"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+def check_not_modified(
+    response: Response, etag: str, if_none_match: Optional[str]
+) -> Optional[Response]:
+    """
+    Set ``etag`` on ``response``; return a 304 if the client already has it.
+
+    The 304 carries the headers already set on ``response`` (such as
+    ``X-Next-Cursor``), as a 200 would.
+    """
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+    if not etag_matches(if_none_match, etag):
+        return None
+    not_modified = Response(status_code=304)
+    not_modified.raw_headers.extend(
+        (name, value)
+        for name, value in response.raw_headers
+        if name != b"content-length"
+    )
+    return not_modified
+
+
+def _viewer_version(viewer_id: int):
+    return (
+        select(models.User.version).where(models.User.id == viewer_id).scalar_subquery()
+    )
+
+
+def feed_etag(db: Session, viewer_id: int, post_ids: List[int], *params) -> str:
+    """
+    ETag for a page of ``post_ids`` as seen by ``viewer_id``.
+
+    Covers the page's posts, the originals they repost and all their
+    authors (by summing versions, which only increase), the viewer's
+    follow/block edges and newly generated image derivatives. ``params``
+    (limit, cursor, ...) are mixed in.
+    """
+    if not post_ids:
+        return make_etag("feed", viewer_id, post_ids, params)
+    posts = models.Post.__table__
+    users = models.User.__table__
+    originals = select(posts.c.original_post_id).where(posts.c.id.in_(post_ids))
+    shown = posts.alias("shown")
+    row = db.execute(
+        select(
+            func.count(),
+            func.coalesce(func.sum(shown.c.version), 0),
+            func.coalesce(func.sum(users.c.version), 0),
+            _viewer_version(viewer_id),
+            select(func.max(models.MediaVariant.id)).scalar_subquery(),
+        )
+        .select_from(shown)
+        .join(users, users.c.id == shown.c.author_id)
+        .where(or_(shown.c.id.in_(post_ids), shown.c.id.in_(originals)))
+    ).one()
+    return make_etag("feed", viewer_id, post_ids, tuple(row), params)
+
+
+def profile_etag(db: Session, user_id: int, viewer_id: int) -> str:
+    """ETag for ``user_id``'s profile as seen by ``viewer_id``"""
+    version = db.execute(
+        select(models.User.version, _viewer_version(viewer_id)).where(
+            models.User.id == user_id
+        )
+    ).one()
+    return make_etag("profile", user_id, viewer_id, tuple(version))
@@ -0,0 +1,131 @@
+"""
+Denormalized data maintenance.
+
+Counters on ``models.Post`` and ``models.User``, media blob reference counts
+and the ``timeline_entries`` home timelines are kept in sync on write by
+listeners in ``models.py``. This module recomputes them from the source
+tables, for use after bulk imports, manual SQL edits, or when upgrading an
+existing database.
+Running it as a script also garbage-collects unreferenced media blobs.
+
+Usage:
+    python counters.py
+"""
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+
+import media
+import models
+from database import SessionLocal
+
+
+def recount_post_counters(db: Session) -> int:
+    """Recompute every post's counters in one statement; returns rows updated"""
+    posts = models.Post.__table__
+    reposts = posts.alias("reposts")
+
+    comments_count = (
+        select(func.count())
+        .where(models.Comment.post_id == posts.c.id)
+        .scalar_subquery()
+    )
+    reactions_count = (
+        select(func.count())
+        .where(models.Reaction.post_id == posts.c.id)
+        .scalar_subquery()
+    )
+    reposts_count = (
+        select(func.count())
+        .where(reposts.c.original_post_id == posts.c.id)
+        .scalar_subquery()
+    )
+
+    result = db.execute(
+        update(posts).values(
+            comments_count=comments_count,
+            reactions_count=reactions_count,
+            reposts_count=reposts_count,
+            # Invalidate ETags built from the old counts
+            version=posts.c.version + 1,
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def recount_user_counters(db: Session) -> int:
+    """Recompute every user's follow and post counts; returns rows updated"""
+    users = models.User.__table__
+    followers = models.followers
+
+    def count(where):
+        return select(func.count()).where(where).scalar_subquery()
+
+    result = db.execute(
+        update(users).values(
+            followers_count=count(followers.c.followed_id == users.c.id),
+            following_count=count(followers.c.follower_id == users.c.id),
+            posts_count=count(models.Post.author_id == users.c.id),
+            version=users.c.version + 1,
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def recount_media_refcounts(db: Session) -> int:
+    """Recompute every media blob's reference count; returns rows updated"""
+    blobs = models.MediaBlob.__table__
+
+    def references(column):
+        return select(func.count()).where(column == blobs.c.url).scalar_subquery()
+
+    result = db.execute(
+        update(blobs).values(
+            refcount=references(models.Post.image_url)
+            + references(models.Post.video_url)
+            + references(models.User.profile_picture)
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def rebuild_timelines(db: Session) -> int:
+    """Rebuild every home timeline from the follow graph; returns edges replayed"""
+    connection = db.connection()
+    connection.execute(delete(models.TimelineEntry.__table__))
+    # Accounts back under the threshold return to fan-out-on-write
+    users = models.User.__table__
+    connection.execute(
+        update(users)
+        .where(
+            users.c.fan_out_on_read,
+            users.c.followers_count <= models.TIMELINE_CELEBRITY_THRESHOLD,
+        )
+        .values(fan_out_on_read=False)
+    )
+    edges = connection.execute(
+        select(models.followers.c.follower_id, models.followers.c.followed_id)
+    ).all()
+    for follower_id, followed_id in edges:
+        models.backfill_timeline(connection, follower_id, followed_id)
+    db.commit()
+    return len(edges)
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        updated = recount_post_counters(db)
+        print(f"Recomputed counters for {updated} posts")
+        updated = recount_user_counters(db)
+        print(f"Recomputed counters for {updated} users")
+        edges = rebuild_timelines(db)
+        print(f"Rebuilt home timelines from {edges} follow relationships")
+        blobs = recount_media_refcounts(db)
+        collected = media.collect_garbage(db)
+        print(f"Recounted references for {blobs} media blobs, removed {collected}")
+    finally:
+        db.close()
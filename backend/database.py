@@ -1,38 +1,252 @@
 import os
+from typing import Optional
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from fastapi import Request
+from sqlalchemy import Delete, Insert, Update, create_engine, event
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+
+from cache import TTLCache
 
 # Get database URL from environment or use default
 # Use absolute path for Windows compatibility
 DATABASE_PATH = os.path.abspath("testbook.db")
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DATABASE_PATH}")
 
-# Normalize Postgres driver to psycopg (v3) if not explicitly set
-if SQLALCHEMY_DATABASE_URL.startswith("postgresql://"):
-    SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace(
-        "postgresql://", "postgresql+psycopg://", 1
-    )
+
+def _normalize_url(url: str) -> str:
+    """Normalize Postgres driver to psycopg (v3) if not explicitly set"""
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+psycopg://", 1)
+    return url
+
+
+SQLALCHEMY_DATABASE_URL = _normalize_url(SQLALCHEMY_DATABASE_URL)
+
+# Connection pool sizing (applies to both SQLite and Postgres)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# SQLite engine profile. "production" enables WAL so readers stop blocking
+# behind writers, plus the pragmas below; "default" keeps SQLite's defaults.
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production")
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    # NORMAL is durable in WAL mode except across power loss
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    # Wait for a lock instead of failing with "database is locked"
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    # Negative values are KiB: 64 MiB page cache per connection
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
 
 # SQLite-specific connection args (only needed for SQLite)
 connect_args = {}
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+if IS_SQLITE:
     connect_args = {"check_same_thread": False}
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine_options = {"connect_args": connect_args}
+if not (IS_SQLITE and ":memory:" in SQLALCHEMY_DATABASE_URL):
+    engine_options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+
+# Read replicas (comma-separated URLs). GET requests read from one of them,
+# except for clients that wrote within READ_YOUR_WRITES_SECONDS, who stay on
+# the primary so they see their own changes despite replication lag.
+DATABASE_REPLICA_URLS = [
+    url.strip()
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads to ``replica`` when one is assigned.
+
+    Flushes and INSERT/UPDATE/DELETE statements always go to the primary, and
+    once a session has flushed, its later reads do too.
+    """
+
+    replica = None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if (
+            self.replica is not None
+            and not self._flushing
+            and not isinstance(clause, (Insert, Update, Delete))
+        ):
+            return self.replica
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options)
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=engine, class_=RoutingSession
+)
 
 Base = declarative_base()
 
 
-def get_db():
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """Apply SQLITE_PRAGMAS to a new SQLite connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+if IS_SQLITE and SQLITE_PROFILE == "production":
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+
+
+replica_engines = []
+for _url in DATABASE_REPLICA_URLS:
+    _replica = create_engine(_normalize_url(_url), **engine_options)
+    if _url.startswith("sqlite") and SQLITE_PROFILE == "production":
+        event.listen(_replica, "connect", apply_sqlite_pragmas)
+    replica_engines.append(_replica)
+
+# Clients (keyed by bearer token or address) that wrote recently
+recent_writers = TTLCache(maxsize=100_000, ttl=READ_YOUR_WRITES_SECONDS)
+
+
+def pool_stats(bind=None) -> dict:
+    """Connection pool usage for ``bind`` (defaults to the main engine)"""
+    pool = (bind or engine).pool
+    stats = {"pool": type(pool).__name__, "status": pool.status()}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    return stats
+
+
+def get_db(request: Request = None):
     db = SessionLocal()
+    if request is not None:
+        route_session(db, request)
     try:
         yield db
     finally:
         db.close()
 
 
+def _client_keys(request: Request) -> list:
+    keys = []
+    authorization = request.headers.get("authorization")
+    if authorization:
+        keys.append(("token", authorization))
+    if request.client:
+        keys.append(("address", request.client.host))
+    return keys
+
+
+def route_session(
+    db: RoutingSession,
+    request: Request,
+    replicas: Optional[list] = None,
+    writers: Optional[TTLCache] = None,
+) -> None:
+    """
+    Point ``db``'s reads at a replica for read-only requests.
+
+    GET/HEAD requests use a replica unless the client wrote within the
+    stickiness window. Writes made through ``db`` mark the client as a recent
+    writer: by token when authenticated, by address otherwise (so a
+    registration is visible to the login that follows it).
+    """
+    replicas = replica_engines if replicas is None else replicas
+    writers = recent_writers if writers is None else writers
+    keys = _client_keys(request)
+    db.info["client_keys"] = keys
+    db.info["recent_writers"] = writers
+
+    if replicas and request.method in ("GET", "HEAD"):
+        if not any(writers.get(key) for key in keys):
+            db.replica = replicas[db.hash_key % len(replicas)]
+
+
+def mark_written(session: RoutingSession) -> None:
+    """
+    Route ``session`` and its client to the primary after a write.
+
+    Flushes do this automatically; call it after statements executed
+    directly on the session's connection.
+    """
+    session.replica = None
+    keys = session.info.get("client_keys")
+    if keys:
+        tokens = [key for key in keys if key[0] == "token"]
+        for key in tokens or keys:
+            session.info["recent_writers"].set(key, True)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _stick_to_primary(session, flush_context):
+    mark_written(session)
+
+
+# Optional async engine (ASYNC_DATABASE=true). Read-heavy endpoints are then
+# served by async handlers (routers/async_reads.py), so concurrency scales with
+# open connections instead of the ~40-thread sync handler pool. Requires
+# aiosqlite for SQLite; Postgres uses psycopg's async mode.
+ASYNC_DATABASE = os.getenv("ASYNC_DATABASE", "false").lower() == "true"
+
+_async_engine = None
+_async_session_factory = None
+
+
+def async_database_url(url: str) -> str:
+    """Map a sync database URL to its async driver"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    # postgresql+psycopg supports asyncio with the same URL
+    return url
+
+
+def get_async_engine():
+    """Create the async engine on first use"""
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        _async_engine = create_async_engine(
+            async_database_url(SQLALCHEMY_DATABASE_URL),
+            **{k: v for k, v in engine_options.items() if k != "connect_args"},
+        )
+        if IS_SQLITE and SQLITE_PROFILE == "production":
+            event.listen(_async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+        _async_session_factory = async_sessionmaker(
+            _async_engine, autoflush=False, expire_on_commit=False
+        )
+    return _async_engine
+
+
+async def get_async_db():
+    get_async_engine()
+    async with _async_session_factory() as db:
+        yield db
+
+
+async def dispose_async_engine():
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = _async_session_factory = None
+
+
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
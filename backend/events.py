@@ -0,0 +1,174 @@
+"""
+Feed events and the pub/sub bus behind ``/api/feed/stream``.
+
+Write handlers publish a ``FeedEvent`` after committing; every open stream
+receives it and forwards the ones its viewer should see. The default
+``InProcessEventBus`` only reaches streams served by the same worker. For
+multi-worker deployments set ``FEED_EVENT_BUS`` to ``module:factory``
+returning a bus that relays events through a broker: subclass
+``InProcessEventBus``, send events to the broker in ``publish`` and pass what
+it receives to ``deliver``.
+"""
+
+import asyncio
+import importlib
+import json
+import os
+import threading
+from typing import AbstractSet, Any, Dict, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+from blocking import blocked_user_ids
+
+# Events a stream may queue before it is told to resync instead
+FEED_STREAM_QUEUE_SIZE = int(os.getenv("FEED_STREAM_QUEUE_SIZE", "100"))
+
+
+class FeedEvent(NamedTuple):
+    # "post", "repost", "reaction", "comment" or "relationship"
+    type: str
+    # Author of the post concerned (for "relationship": the other user)
+    author_id: int
+    # User who caused the event
+    actor_id: int
+    data: Dict[str, Any]
+
+
+# Queued in place of events a slow stream could not keep up with
+RESYNC = FeedEvent("resync", 0, 0, {})
+
+
+class InProcessEventBus:
+    """Fans events out to subscriber queues in this process"""
+
+    def __init__(self, queue_size: int = FEED_STREAM_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[asyncio.Queue, asyncio.AbstractEventLoop] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> asyncio.Queue:
+        """Register a queue for new events; call from the event loop"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def publish(self, event: FeedEvent) -> None:
+        """Publish ``event``; safe to call from sync handlers' threads"""
+        self.deliver(event)
+
+    def deliver(self, event: FeedEvent) -> None:
+        """Hand ``event`` to every local subscriber"""
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(_enqueue, queue, event)
+            except RuntimeError:
+                # The subscriber's loop has closed
+                self.unsubscribe(queue)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+
+def _enqueue(queue: asyncio.Queue, event: FeedEvent) -> None:
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # Drop the backlog; the client refetches instead
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(RESYNC)
+
+
+_bus: Optional[InProcessEventBus] = None
+_bus_lock = threading.Lock()
+
+
+def _load_bus() -> InProcessEventBus:
+    factory_path = os.getenv("FEED_EVENT_BUS")
+    if not factory_path:
+        return InProcessEventBus()
+    module_name, _, attribute = factory_path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)()
+
+
+def get_event_bus() -> InProcessEventBus:
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            _bus = _load_bus()
+        return _bus
+
+
+def set_event_bus(bus: Optional[InProcessEventBus]) -> None:
+    """Replace the bus (``None`` reloads it from ``FEED_EVENT_BUS`` on next use)"""
+    global _bus
+    with _bus_lock:
+        _bus = bus
+
+
+def publish(event_type: str, author_id: int, actor_id: int, **data: Any) -> None:
+    """Publish a feed event on the configured bus"""
+    get_event_bus().publish(FeedEvent(event_type, author_id, actor_id, data))
+
+
+def format_sse(event: FeedEvent) -> str:
+    """Encode ``event`` as a Server-Sent Events message"""
+    payload = {"author_id": event.author_id, "actor_id": event.actor_id, **event.data}
+    return f"event: {event.type}\ndata: {json.dumps(payload)}\n\n"
+
+
+class StreamAudience:
+    """
+    Decides which events a viewer's stream receives.
+
+    Events about posts by the viewer or by accounts they follow are passed,
+    unless the author or the actor is blocked in either direction. The
+    follow and block sets are reloaded when a "relationship" event involves
+    the viewer.
+    """
+
+    def __init__(
+        self, viewer_id: int, followed: AbstractSet[int], blocked: AbstractSet[int]
+    ):
+        self.viewer_id = viewer_id
+        self.followed = followed
+        self.blocked = blocked
+
+    @classmethod
+    def load(cls, bind, viewer_id: int) -> "StreamAudience":
+        """Read the viewer's follow and block sets (runs in the threadpool)"""
+        followers = models.followers
+        with Session(bind=bind) as db:
+            followed = db.scalars(
+                select(followers.c.followed_id).where(
+                    followers.c.follower_id == viewer_id
+                )
+            ).all()
+            blocked = blocked_user_ids(db, viewer_id)
+        return cls(viewer_id, set(followed), blocked)
+
+    def needs_reload(self, event: FeedEvent) -> bool:
+        return event.type == "relationship" and self.viewer_id in (
+            event.author_id,
+            event.actor_id,
+        )
+
+    def allows(self, event: FeedEvent) -> bool:
+        if event.type == "relationship":
+            return False
+        if event.author_id != self.viewer_id and event.author_id not in self.followed:
+            return False
+        return (
+            event.author_id not in self.blocked and event.actor_id not in self.blocked
+        )
@@ -0,0 +1,134 @@
+"""
+Batched post hydration.
+
+Turns a page of post IDs into ``PostResponse`` objects using a fixed number
+of queries, no matter how many posts are on the page. Counts come from the
+denormalized counter columns on ``models.Post``, so child tables are only
+touched for the viewer's own reactions and reposts.
+"""
+
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy.orm import Session, joinedload
+
+import models
+import schemas
+from media import image_srcsets
+
+
+def hydrate_posts(
+    db: Session,
+    post_ids: List[int],
+    viewer: Optional[models.User] = None,
+    blocked_user_ids: Optional[Set[int]] = None,
+) -> List[schemas.PostResponse]:
+    """
+    Build responses for ``post_ids``, preserving their order.
+
+    Queries issued (independent of page size):
+        1. posts + authors + original posts/authors (joined eager load)
+        2. the viewer's reactions (IN)
+        3. the viewer's reposts (IN)
+        4. image derivatives for the srcsets (IN, only if the page has images)
+
+    Callers exclude blocked authors when selecting ``post_ids`` (see
+    ``blocking.not_blocked``); an original post by an author in
+    ``blocked_user_ids`` is rendered as ``None``.
+    """
+    if not post_ids:
+        return []
+
+    blocked_user_ids = blocked_user_ids or set()
+
+    posts = (
+        db.query(models.Post)
+        .options(
+            joinedload(models.Post.author),
+            joinedload(models.Post.original_post).joinedload(models.Post.author),
+        )
+        .filter(models.Post.id.in_(post_ids))
+        .all()
+    )
+    posts_by_id = {post.id: post for post in posts}
+
+    user_reactions: Dict[int, str] = {}
+    reposted_ids: Set[int] = set()
+    if viewer is not None:
+        user_reactions = dict(
+            db.query(models.Reaction.post_id, models.Reaction.reaction_type)
+            .filter(
+                models.Reaction.user_id == viewer.id,
+                models.Reaction.post_id.in_(posts_by_id),
+            )
+            .all()
+        )
+        reposted_ids = {
+            row[0]
+            for row in db.query(models.Post.original_post_id)
+            .filter(
+                models.Post.author_id == viewer.id,
+                models.Post.original_post_id.in_(posts_by_id),
+            )
+            .all()
+        }
+
+    srcsets = image_srcsets(
+        db,
+        [post.image_url for post in posts]
+        + [post.original_post.image_url for post in posts if post.original_post],
+    )
+
+    result = []
+    for post_id in post_ids:
+        post = posts_by_id.get(post_id)
+        if post is None:
+            continue
+
+        original_post = None
+        orig = post.original_post if post.is_repost else None
+        if orig is not None and orig.author_id not in blocked_user_ids:
+            original_post = build_post_response(
+                orig, embedded=True, image_srcset=srcsets.get(orig.image_url)
+            )
+
+        response = build_post_response(
+            post,
+            user_reaction=user_reactions.get(post.id),
+            has_reposted=post.id in reposted_ids,
+            original_post=original_post,
+            image_srcset=srcsets.get(post.image_url),
+        )
+        result.append(response)
+
+    return result
+
+
+def build_post_response(
+    post: models.Post,
+    user_reaction: Optional[str] = None,
+    has_reposted: bool = False,
+    original_post: Optional[schemas.PostResponse] = None,
+    embedded: bool = False,
+    image_srcset: Optional[str] = None,
+) -> schemas.PostResponse:
+    """Build a response; ``embedded`` renders an original post inside a repost"""
+    return schemas.PostResponse(
+        id=post.id,
+        content=post.content,
+        image_url=post.image_url,
+        image_srcset=image_srcset,
+        video_url=post.video_url,
+        is_repost=False if embedded else post.is_repost,
+        original_post_id=None if embedded else post.original_post_id,
+        original_post=original_post,
+        author_id=post.author_id,
+        author_username=post.author.username,
+        author_display_name=post.author.display_name,
+        author_profile_picture=post.author.profile_picture,
+        created_at=post.created_at,
+        comments_count=post.comments_count,
+        reactions_count=post.reactions_count,
+        reposts_count=post.reposts_count,
+        user_reaction=user_reaction,
+        has_reposted=has_reposted,
+    )
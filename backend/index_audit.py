@@ -0,0 +1,193 @@
+"""
+Index audit for router queries.
+
+Seeds a scratch database, drives the API through a representative set of
+reads and writes, captures every SQL statement the routers issue and runs
+EXPLAIN on each one. Any statement whose plan contains a full table scan is
+reported.
+
+SQLite plans come from ``EXPLAIN QUERY PLAN`` ("SCAN <table>" without an
+index). Postgres plans come from ``EXPLAIN (FORMAT JSON)`` with
+``enable_seqscan`` off, so a "Seq Scan" means no usable index exists rather
+than the planner preferring a scan on a tiny table.
+
+Usage:
+    python index_audit.py                                       # temporary SQLite
+    python index_audit.py --database-url postgresql://.../audit  # scratch Postgres
+
+The target database is created, seeded and written to. Never point it at
+real data. Exits with status 1 when a full scan is found.
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+from collections import defaultdict
+
+# "SCAN CONSTANT ROW" is a FROM-less SELECT (such as SELECT EXISTS), not a table
+SQLITE_FULL_SCAN = re.compile(
+    r"^SCAN (?!CONSTANT ROW)(\w+)(?!.*USING (COVERING )?INDEX)"
+)
+AUDITED_STATEMENTS = ("SELECT", "UPDATE", "DELETE", "INSERT")
+
+
+def _requests(db, models):
+    """(label, method, path, json) for the endpoints under audit"""
+    viewer = db.query(models.User).filter_by(username="sarahjohnson").one()
+    other = db.query(models.User).filter_by(username="mikechen").one()
+    post = db.query(models.Post).filter_by(author_id=other.id).first()
+    return viewer, [
+        ("auth.me", "GET", "/api/auth/me", None),
+        ("feed.all", "GET", "/api/feed/all?limit=5", None),
+        ("feed.all (cursor)", "GET", "/api/feed/all?limit=5&cursor={cursor}", None),
+        ("feed.following", "GET", "/api/feed/following", None),
+        ("users.profile", "GET", f"/api/users/{other.username}", None),
+        ("users.followers", "GET", f"/api/users/{other.username}/followers", None),
+        ("users.following", "GET", f"/api/users/{other.username}/following", None),
+        ("users.posts", "GET", f"/api/users/{other.username}/posts", None),
+        ("posts.detail", "GET", f"/api/posts/{post.id}", None),
+        ("posts.create", "POST", "/api/posts/", {"content": "Index audit"}),
+        (
+            "posts.comment",
+            "POST",
+            f"/api/posts/{post.id}/comments",
+            {"content": "Audit comment"},
+        ),
+        (
+            "posts.react",
+            "POST",
+            f"/api/posts/{post.id}/reactions",
+            {"reaction_type": "wow"},
+        ),
+        ("posts.unreact", "DELETE", f"/api/posts/{post.id}/reactions", None),
+        ("posts.repost", "POST", "/api/posts/repost", {"original_post_id": post.id}),
+        ("posts.unrepost", "DELETE", f"/api/posts/repost/{post.id}", None),
+        ("users.follow", "POST", "/api/users/newuser123/follow", None),
+        ("users.unfollow", "DELETE", "/api/users/newuser123/follow", None),
+        ("users.block", "POST", "/api/users/newuser123/block", None),
+        ("users.unblock", "DELETE", "/api/users/newuser123/block", None),
+        ("posts.delete", "DELETE", "/api/posts/{created_post}", None),
+        # Last: removes the viewer and cascades through every child table
+        ("users.delete_me", "DELETE", "/api/users/me", None),
+    ]
+
+
+def _sqlite_full_scans(cursor, statement, parameters):
+    cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+    return [row[3] for row in cursor.fetchall() if SQLITE_FULL_SCAN.match(str(row[3]))]
+
+
+def _postgres_full_scans(cursor, statement, parameters):
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+    plan = cursor.fetchone()[0][0]["Plan"]
+    scans = []
+
+    def walk(node):
+        if node.get("Node Type") == "Seq Scan":
+            scans.append(f"Seq Scan on {node.get('Relation Name')}")
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan)
+    return scans
+
+
+def run_audit(database_url: str) -> int:
+    """Run the audit against ``database_url``; returns the number of findings"""
+    # database.py reads DATABASE_URL at import time
+    os.environ["DATABASE_URL"] = database_url
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    import models
+    from auth import create_access_token
+    from database import SessionLocal, engine, init_db
+    from main import app
+    from seed import seed_database
+
+    init_db()
+    seed_database()
+
+    db = SessionLocal()
+    try:
+        viewer, requests = _requests(db, models)
+        headers = {
+            "Authorization": f"Bearer {create_access_token({'sub': viewer.email})}"
+        }
+    finally:
+        db.close()
+
+    captured = []
+    label = {"current": None}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        keyword = statement.lstrip().split(None, 1)[0].upper()
+        if label["current"] and not executemany and keyword in AUDITED_STATEMENTS:
+            captured.append((label["current"], statement, parameters))
+
+    context = {"cursor": "", "created_post": 0}
+    with TestClient(app) as client:
+        for name, method, path, body in requests:
+            label["current"] = name
+            response = client.request(
+                method, path.format(**context), json=body, headers=headers
+            )
+            label["current"] = None
+            if response.status_code >= 400:
+                print(f"  ! {name}: HTTP {response.status_code} {response.text}")
+            context["cursor"] = response.headers.get("X-Next-Cursor", context["cursor"])
+            if name == "posts.create":
+                context["created_post"] = response.json()["id"]
+
+    event.remove(engine, "before_cursor_execute", capture)
+
+    is_postgres = engine.dialect.name == "postgresql"
+    explain = _postgres_full_scans if is_postgres else _sqlite_full_scans
+    findings = defaultdict(list)
+    seen = set()
+
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        if is_postgres:
+            cursor.execute("SET enable_seqscan = off")
+        for name, statement, parameters in captured:
+            if (name, statement) in seen:
+                continue
+            seen.add((name, statement))
+            for scan in explain(cursor, statement, parameters):
+                findings[name].append((scan, " ".join(statement.split())))
+        raw.rollback()
+    finally:
+        raw.close()
+
+    print(f"Audited {len(seen)} statements from {len(requests)} requests")
+    print(f"Database: {engine.dialect.name}")
+    for name, scans in findings.items():
+        print(f"\n{name}")
+        for scan, statement in scans:
+            print(f"  FULL SCAN: {scan}")
+            print(f"    {statement[:200]}")
+    if not findings:
+        print("No full table scans found")
+
+    return sum(len(scans) for scans in findings.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--database-url",
+        help="Scratch database to audit (default: a temporary SQLite file)",
+    )
+    args = parser.parse_args()
+
+    url = args.database_url
+    if url is None:
+        url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'index_audit.db')}"
+
+    sys.exit(1 if run_audit(url) else 0)
@@ -1,19 +1,30 @@
+import hmac
 import os
 from contextlib import asynccontextmanager
+from typing import Optional
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
 
-from database import init_db
+import media
+from auth import password_pool, user_cache
+from blocking import blocked_ids_cache
+from database import (
+    ASYNC_DATABASE,
+    dispose_async_engine,
+    init_db,
+    pool_stats,
+    replica_engines,
+)
 from logger import setup_logging
-from routers import auth, dev, feed, posts, users
+from middleware import CompressionMiddleware, RequestSizeLimitMiddleware
+from pagination import NEXT_CURSOR_HEADER
+from routers import async_reads, auth, dev, feed, posts, users
+from static_files import FrontendStaticFiles, MediaStaticFiles
 
 # Load environment variables from .env file
 load_dotenv()
@@ -28,6 +39,11 @@ async def lifespan(app: FastAPI):
     init_db()
     yield
 
+    # Stop the bcrypt worker processes
+    password_pool.shutdown()
+    media.shutdown()
+    await dispose_async_engine()
+
 
 # Initialize rate limiter based on environment
 # In testing mode, use much higher limits to avoid test interference
@@ -58,28 +74,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
     max_age=600,
 )
 
 
 # Request size limiting middleware
-class RequestSizeLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, max_upload_size: int = 10 * 1024 * 1024):  # 10MB default
-        super().__init__(app)
-        self.max_upload_size = max_upload_size
-
-    async def dispatch(self, request: Request, call_next):
-        if request.method in ["POST", "PUT", "PATCH"]:
-            content_length = request.headers.get("content-length")
-            if content_length and int(content_length) > self.max_upload_size:
-                return JSONResponse(
-                    status_code=413, content={"detail": "Request body too large"}
-                )
-        return await call_next(request)
-
-
 app.add_middleware(RequestSizeLimitMiddleware, max_upload_size=10 * 1024 * 1024)
 
+# gzip/brotli for /api responses (COMPRESSION_* settings in middleware.py)
+app.add_middleware(CompressionMiddleware)
+
 
 # Health check endpoints (must be before static mounts)
 @app.get("/api")
@@ -94,7 +99,42 @@ async def health_check(request: Request):
     return {"status": "healthy"}
 
 
+def require_metrics_access(authorization: Optional[str] = Header(None)) -> None:
+    """
+    Allow /api/metrics for the ``METRICS_TOKEN`` bearer token, or in test mode.
+
+    Read per request, like ``TESTING`` for the dev endpoints.
+    """
+    token = os.getenv("METRICS_TOKEN")
+    if (
+        token
+        and authorization
+        and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
+    ):
+        return
+    if os.getenv("TESTING", "false").lower() == "true":
+        return
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Metrics require the METRICS_TOKEN bearer token",
+    )
+
+
+@app.get("/api/metrics", dependencies=[Depends(require_metrics_access)])
+async def metrics():
+    """In-process cache and connection pool metrics for this worker"""
+    return {
+        "user_cache": user_cache.stats(),
+        "blocked_ids_cache": blocked_ids_cache.stats(),
+        "db_pool": pool_stats(),
+        "db_replica_pools": [pool_stats(replica) for replica in replica_engines],
+    }
+
+
 # Include routers BEFORE static file mounts
+if ASYNC_DATABASE:
+    # Registered first so these async reads take precedence over the sync ones
+    app.include_router(async_reads.router, prefix="/api")
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(posts.router, prefix="/api/posts", tags=["Posts"])
@@ -104,9 +144,12 @@ app.include_router(dev.router, prefix="/api/dev", tags=["Development"])
 # Mount static files for images/videos
 os.makedirs("static/images", exist_ok=True)
 os.makedirs("static/videos", exist_ok=True)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", MediaStaticFiles(directory="static"), name="static")
 
 # Serve frontend in production (when frontend-dist exists)
 # This must be LAST to not interfere with API routes
 if os.path.exists("frontend-dist"):
-    app.mount("/", StaticFiles(directory="frontend-dist", html=True), name="frontend")
+    # Run precompress.py on the build to serve gzip/brotli without runtime cost
+    app.mount(
+        "/", FrontendStaticFiles(directory="frontend-dist", html=True), name="frontend"
+    )
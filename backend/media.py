@@ -0,0 +1,345 @@
+"""
+Uploaded media: blob registry, garbage collection and image derivatives.
+
+Uploads are stored once per distinct content (see ``uploads.py``) and
+registered in ``media_blobs``. Listeners in ``models.py`` count the posts and
+profiles referencing each blob; once nothing does, ``collect_garbage``
+removes the file along with its derivatives.
+
+After an image upload, resized WebP renditions are generated in a background
+process pool, written next to the original and recorded in
+``media_variants``. Post responses expose them as ``image_srcset`` so feed
+cards download an image sized for their slot instead of the full-resolution
+original.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+from auth import WORKER_START_METHOD
+from uploads import DIGEST_SIZE, StoredUpload, save_upload
+
+# Content-addressed upload store and the URL it is served under
+UPLOAD_DIR = Path(__file__).parent / "static" / "uploads"
+UPLOAD_URL = "/static/uploads"
+
+# Unreferenced blobs uploaded (or re-uploaded, for identical content) more
+# recently than this are kept: the post or profile that will use them may not
+# be saved yet
+MEDIA_GC_GRACE_SECONDS = float(os.getenv("MEDIA_GC_GRACE_SECONDS", "3600"))
+
+logger = logging.getLogger(__name__)
+
+MEDIA_VARIANT_WIDTHS = tuple(
+    sorted(
+        int(width)
+        for width in os.getenv("MEDIA_VARIANT_WIDTHS", "320,640,1080").split(",")
+        if width.strip()
+    )
+)
+MEDIA_WEBP_QUALITY = int(os.getenv("MEDIA_WEBP_QUALITY", "80"))
+# 0 workers = generate in the request threadpool
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", str(min(2, os.cpu_count() or 1))))
+
+# GIFs are left alone: resizing would drop their animation
+DERIVABLE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def upload_url(path: Path) -> str:
+    return f"{UPLOAD_URL}/{path.relative_to(UPLOAD_DIR).as_posix()}"
+
+
+def upload_path(url: str) -> Path:
+    return UPLOAD_DIR / url[len(UPLOAD_URL) + 1 :]
+
+
+# URLs of content-addressed blobs (legacy uploads and seed images differ)
+_BLOB_URL = re.compile(
+    rf"^{re.escape(UPLOAD_URL)}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{{DIGEST_SIZE * 2}}}\."
+)
+
+
+def register_blob(db: Session, url: str, stored: StoredUpload) -> models.MediaBlob:
+    """Record a stored upload (or refresh ``uploaded_at`` for a duplicate)"""
+    now = datetime.now(timezone.utc)
+    blob = db.query(models.MediaBlob).filter(models.MediaBlob.url == url).first()
+    if blob is None:
+        blob = models.MediaBlob(
+            url=url, digest=stored.digest, size=stored.size, uploaded_at=now
+        )
+        db.add(blob)
+        try:
+            db.commit()
+            return blob
+        except IntegrityError:
+            # Registered concurrently by an identical upload
+            db.rollback()
+            blob = db.query(models.MediaBlob).filter(models.MediaBlob.url == url).one()
+    blob.uploaded_at = now
+    db.commit()
+    return blob
+
+
+async def store_upload(
+    db: Session, file: UploadFile, extension: str
+) -> Tuple[str, StoredUpload]:
+    """
+    Save ``file`` to the blob store and register it; returns its URL.
+
+    Identical content shares the existing blob, and registering restarts its
+    grace period. If that blob was collected between being found and being
+    registered, the file is written again.
+    """
+    stored = await save_upload(file, UPLOAD_DIR, extension)
+    url = upload_url(stored.path)
+    await run_in_threadpool(register_blob, db, url, stored)
+    if not stored.created and not await run_in_threadpool(stored.path.exists):
+        await file.seek(0)
+        stored = await save_upload(file, UPLOAD_DIR, extension)
+        await run_in_threadpool(register_blob, db, url, stored)
+    return url, stored
+
+
+def require_blobs(db: Session, urls: Iterable[Optional[str]]) -> None:
+    """
+    Reject references to blobs that have been collected (400).
+
+    Call after flushing the post or profile that references ``urls``: its
+    reference is then counted, so a blob found here can no longer be
+    collected once the transaction commits.
+    """
+    urls = {url for url in urls if url and _BLOB_URL.match(url)}
+    if not urls:
+        return
+    blobs = models.MediaBlob.__table__
+    found = db.scalars(select(blobs.c.url).where(blobs.c.url.in_(urls))).all()
+    if len(found) < len(urls):
+        db.rollback()
+        raise HTTPException(
+            status_code=400, detail="Uploaded file has expired, please upload it again"
+        )
+
+
+def collect_garbage(db: Session, urls: Optional[Iterable[Optional[str]]] = None) -> int:
+    """
+    Delete unreferenced blobs, their files and derivatives; returns the count.
+
+    Only ``urls`` are considered when given (call after releasing them);
+    otherwise every blob is, which also catches uploads never attached to a
+    post or profile. Blobs inside the grace period are skipped either way,
+    since a new uploader of identical content may hold the URL.
+    """
+    blobs = models.MediaBlob.__table__
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=MEDIA_GC_GRACE_SECONDS)
+    unreferenced = (blobs.c.refcount <= 0, blobs.c.uploaded_at < cutoff)
+    query = select(blobs.c.id, blobs.c.url).where(*unreferenced)
+    if urls is not None:
+        urls = {url for url in urls if url}
+        if not urls:
+            return 0
+        query = query.where(blobs.c.url.in_(urls))
+
+    doomed = []
+    collected = {}
+    for blob_id, url in db.execute(query).all():
+        # Re-checked in the DELETE in case the blob was referenced or
+        # re-uploaded since the SELECT
+        result = db.execute(delete(blobs).where(blobs.c.id == blob_id, *unreferenced))
+        if result.rowcount:
+            path = upload_path(url)
+            collected[url] = path
+            doomed.extend(delete_derivatives(db, url, path.parent))
+    db.commit()
+
+    # Files go only once the rows are gone for good. An identical upload may
+    # have registered the blob again meanwhile; its file then stays.
+    if collected:
+        reregistered = set(
+            db.scalars(select(blobs.c.url).where(blobs.c.url.in_(collected)))
+        )
+        doomed.extend(
+            path for url, path in collected.items() if url not in reregistered
+        )
+    for path in doomed:
+        path.unlink(missing_ok=True)
+    return len(collected)
+
+
+def variant_path(source: Path, width: int) -> Path:
+    return source.with_name(f"{source.stem}.{width}w.webp")
+
+
+def generate_derivatives(
+    source_path: str, widths: Iterable[int], quality: int = MEDIA_WEBP_QUALITY
+) -> List[Tuple[int, str]]:
+    """
+    Write WebP renditions of ``source_path``; returns ``(width, filename)`` pairs.
+
+    Widths above the original's are skipped, but the original's own width is
+    added (capped at the largest width) so every image gets a WebP copy.
+    Runs in a worker process.
+    """
+    from PIL import Image, ImageOps
+
+    source = Path(source_path)
+    with Image.open(source) as opened:
+        image = ImageOps.exif_transpose(opened)
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = "A" in image.getbands() or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        widths = sorted(set(widths))
+        targets = [width for width in widths if width < image.width]
+        largest = min(image.width, widths[-1]) if widths else image.width
+        if largest not in targets:
+            targets.append(largest)
+
+        results = []
+        for width in targets:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.Resampling.LANCZOS)
+            destination = variant_path(source, width)
+            partial = destination.with_suffix(".webp.part")
+            resized.save(partial, "WEBP", quality=quality, method=4)
+            os.replace(partial, destination)
+            results.append((width, destination.name))
+    return results
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=MEDIA_WORKERS,
+                mp_context=multiprocessing.get_context(WORKER_START_METHOD),
+            )
+        return _executor
+
+
+def _discard_executor(executor: ProcessPoolExecutor) -> None:
+    """Drop a pool broken by a dead worker; the next task starts a new one"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def _record_variants(bind, source_url: str, variants: List[Tuple[int, str]]) -> None:
+    base_url = source_url.rsplit("/", 1)[0]
+    with Session(bind=bind) as db:
+        db.query(models.MediaVariant).filter(
+            models.MediaVariant.source_url == source_url
+        ).delete(synchronize_session=False)
+        for width, filename in variants:
+            db.add(
+                models.MediaVariant(
+                    source_url=source_url,
+                    url=f"{base_url}/{filename}",
+                    width=width,
+                    format="webp",
+                )
+            )
+        db.commit()
+
+
+async def process_image(source_url: str, source_path: Path, bind) -> None:
+    """
+    Background task: generate and record derivatives of an uploaded image.
+
+    ``bind`` is the engine to record them in (the request session's). Failures
+    are logged; the original upload is unaffected.
+    """
+    if source_path.suffix.lower() not in DERIVABLE_EXTENSIONS:
+        return
+    try:
+        if MEDIA_WORKERS <= 0:
+            variants = await run_in_threadpool(
+                generate_derivatives, str(source_path), MEDIA_VARIANT_WIDTHS
+            )
+        else:
+            loop = asyncio.get_running_loop()
+            executor = _get_executor()
+            try:
+                variants = await loop.run_in_executor(
+                    executor,
+                    generate_derivatives,
+                    str(source_path),
+                    MEDIA_VARIANT_WIDTHS,
+                )
+            except BrokenProcessPool:
+                _discard_executor(executor)
+                raise
+        await run_in_threadpool(_record_variants, bind, source_url, variants)
+    except Exception:
+        logger.warning(
+            "Could not generate derivatives for %s", source_url, exc_info=True
+        )
+
+
+def delete_derivatives(db: Session, source_url: str, directory: Path) -> List[Path]:
+    """
+    Delete the recorded derivatives of ``source_url``; returns their files.
+
+    The caller removes the files after committing.
+    """
+    variants = (
+        db.query(models.MediaVariant)
+        .filter(models.MediaVariant.source_url == source_url)
+        .all()
+    )
+    for variant in variants:
+        db.delete(variant)
+    return [directory / Path(variant.url).name for variant in variants]
+
+
+def image_srcsets(db: Session, urls: Iterable[Optional[str]]) -> Dict[str, str]:
+    """Map each image URL with derivatives to its ``srcset`` (one query)"""
+    urls = {url for url in urls if url}
+    if not urls:
+        return {}
+    rows = (
+        db.query(
+            models.MediaVariant.source_url,
+            models.MediaVariant.url,
+            models.MediaVariant.width,
+        )
+        .filter(
+            models.MediaVariant.source_url.in_(urls),
+            models.MediaVariant.format == "webp",
+        )
+        .order_by(models.MediaVariant.source_url, models.MediaVariant.width)
+        .all()
+    )
+    srcsets: Dict[str, List[str]] = {}
+    for source_url, url, width in rows:
+        srcsets.setdefault(source_url, []).append(f"{url} {width}w")
+    return {url: ", ".join(candidates) for url, candidates in srcsets.items()}
@@ -0,0 +1,260 @@
+"""
+Pure ASGI middleware.
+
+These wrap the app directly instead of subclassing ``BaseHTTPMiddleware``,
+which runs every request through an extra task and re-wrapped body streams.
+Requests they don't apply to are passed straight through.
+"""
+
+import os
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from static_files import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+# Brotli's top qualities are far too slow for per-request compression
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+
+class RequestBodyTooLarge(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=413, detail="Request body too large")
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Reject request bodies larger than ``max_upload_size`` bytes with 413.
+
+    A ``Content-Length`` above the limit is refused before the body is read.
+    Bodies are also counted as ``receive()`` delivers them, so chunked
+    uploads (no ``Content-Length``) and understated lengths are cut off as
+    soon as they cross the limit instead of being read to the end.
+    """
+
+    methods = ("POST", "PUT", "PATCH")
+
+    def __init__(self, app: ASGIApp, max_upload_size: int = 10 * 1024 * 1024):
+        self.app = app
+        self.max_upload_size = max_upload_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in self.methods:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    too_large = int(value) > self.max_upload_size
+                except ValueError:
+                    await self._reject(
+                        scope, receive, send, 400, "Invalid Content-Length"
+                    )
+                    return
+                if too_large:
+                    await self._reject(
+                        scope, receive, send, 413, "Request body too large"
+                    )
+                    return
+                break
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_upload_size:
+                    # Raised inside the app, so its exception handlers turn
+                    # this into a 413 response
+                    raise RequestBodyTooLarge()
+            return message
+
+        async def tracked_send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except RequestBodyTooLarge as exc:
+            # Only reached if something in the app let the exception escape
+            if response_started:
+                raise
+            await self._reject(scope, receive, send, exc.status_code, exc.detail)
+
+    async def _reject(
+        self, scope: Scope, receive: Receive, send: Send, status_code: int, detail: str
+    ) -> None:
+        response = JSONResponse(status_code=status_code, content={"detail": detail})
+        await response(scope, receive, send)
+
+
+# Media types worth compressing; images, video, archives and fonts are
+# already compressed and pass through untouched
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/problem+json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        # wbits 16+: gzip container
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        # Sync flush so each chunk of a stream reaches the client promptly
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Compress responses under ``path_prefix`` with brotli or gzip.
+
+    The coding is chosen from ``Accept-Encoding`` (brotli first, if the
+    optional ``brotli`` package is installed). A response delivered in one
+    body message is compressed only if it is at least ``minimum_size``
+    bytes. Streamed responses are compressed chunk by chunk and flushed
+    after each one, so long-lived streams are not held back. Responses that
+    are already encoded, not a text-like media type, or marked
+    ``Cache-Control: no-transform`` pass through.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        path_prefix: str = "/api/",
+        minimum_size: int = COMPRESSION_MINIMUM_SIZE,
+        gzip_level: int = COMPRESSION_GZIP_LEVEL,
+        brotli_quality: int = COMPRESSION_BROTLI_QUALITY,
+    ):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _select_encoding(self, scope: Scope) -> Optional[str]:
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding"))
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def _encoder(self, encoding: str):
+        if encoding == "br":
+            return _BrotliEncoder(self.brotli_quality)
+        return _GzipEncoder(self.gzip_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        encoding = self._select_encoding(scope)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        encoder = None
+        # "undecided" until the first body message, then "compress" or "pass"
+        mode = "undecided"
+
+        async def compressing_send(message: Message) -> None:
+            nonlocal start, encoder, mode
+            if message["type"] == "http.response.start":
+                start = message
+                if not _is_compressible(message):
+                    mode = "pass"
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or mode == "pass":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if mode == "undecided":
+                if not more_body and len(body) < self.minimum_size:
+                    mode = "pass"
+                    await send(start)
+                    await send(message)
+                    return
+                mode = "compress"
+                encoder = self._encoder(encoding)
+                headers = MutableHeaders(raw=start["headers"])
+                headers["content-encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    # The encoded bytes differ from what the strong ETag names
+                    headers["etag"] = f"W/{etag}"
+                if more_body:
+                    del headers["content-length"]
+                    await send(start)
+                else:
+                    body = encoder.finish(body)
+                    headers["content-length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+            if more_body:
+                chunk = encoder.compress(body)
+                if chunk:
+                    await send(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+            else:
+                await send({"type": "http.response.body", "body": encoder.finish(body)})
+
+        await self.app(scope, receive, compressing_send)
+
+
+def _is_compressible(start: Message) -> bool:
+    if start["status"] < 200 or start["status"] in (204, 304):
+        return False
+    headers = Headers(raw=start["headers"])
+    if "content-encoding" in headers:
+        return False
+    if "no-transform" in headers.get("cache-control", "").lower():
+        return False
+    content_type = headers.get("content-type", "").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
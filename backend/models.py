@@ -1,3 +1,4 @@
+import os
 from datetime import datetime, timezone
 
 from sqlalchemy import (
@@ -5,21 +6,35 @@ from sqlalchemy import (
     Column,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
     Table,
     Text,
+    UniqueConstraint,
+    and_,
+    delete,
+    event,
+    exists,
+    false,
+    insert,
+    literal,
+    select,
+    update,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import Session, attributes, object_session, relationship
 
 from database import Base
 
 # Association tables for many-to-many relationships
+# The composite primary keys serve lookups by the first column; the reverse
+# indexes serve "who follows X" / "who blocks X".
 followers = Table(
     "followers",
     Base.metadata,
     Column("follower_id", Integer, ForeignKey("users.id"), primary_key=True),
     Column("followed_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Index("ix_followers_followed_id_follower_id", "followed_id", "follower_id"),
 )
 
 blocks = Table(
@@ -27,6 +42,7 @@ blocks = Table(
     Base.metadata,
     Column("blocker_id", Integer, ForeignKey("users.id"), primary_key=True),
     Column("blocked_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Index("ix_blocks_blocked_id_blocker_id", "blocked_id", "blocker_id"),
 )
 
 
@@ -43,6 +59,20 @@ class User(Base):
     theme = Column(String, default="light")  # light or dark
     text_density = Column(String, default="normal")  # compact or normal
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # Denormalized counters, kept in sync by the listeners below.
+    # Run `python counters.py` to recompute them from the source tables.
+    followers_count = Column(Integer, default=0, server_default="0", nullable=False)
+    following_count = Column(Integer, default=0, server_default="0", nullable=False)
+    posts_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # Set once a post skipped fan-out-on-write (see "Home timeline fan-out")
+    fan_out_on_read = Column(
+        Boolean, default=False, server_default=false(), nullable=False
+    )
+    # Bumped on any change visible in a profile (see "Change versions" below)
+    version = Column(Integer, default=0, server_default="0", nullable=False)
+    # Bumped when a block involving this user is added or removed
+    # (validates the cached sets in blocking.py)
+    blocks_version = Column(Integer, default=0, server_default="0", nullable=False)
 
     # Relationships
     posts = relationship("Post", back_populates="author", cascade="all, delete-orphan")
@@ -74,6 +104,14 @@ class User(Base):
 
 class Post(Base):
     __tablename__ = "posts"
+    __table_args__ = (
+        # Feed pages: ORDER BY created_at DESC, id DESC (scanned backwards)
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        # Profile pages and follow backfill: one author's posts, newest first
+        Index("ix_posts_author_id_created_at_id", "author_id", "created_at", "id"),
+        # Repost lookups: "has the viewer reposted X" and repost counts
+        Index("ix_posts_original_post_id_author_id", "original_post_id", "author_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -84,6 +122,14 @@ class Post(Base):
     original_post_id = Column(Integer, ForeignKey("posts.id"), nullable=True)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
+    # Denormalized counters, kept in sync by the listeners below.
+    # Run `python counters.py` to recompute them from the source tables.
+    comments_count = Column(Integer, default=0, server_default="0", nullable=False)
+    reactions_count = Column(Integer, default=0, server_default="0", nullable=False)
+    reposts_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # Bumped on any change visible in a post response
+    version = Column(Integer, default=0, server_default="0", nullable=False)
+
     # Relationships
     author = relationship("User", back_populates="posts")
     comments = relationship(
@@ -97,6 +143,11 @@ class Post(Base):
 
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        Index("ix_comments_post_id_created_at", "post_id", "created_at"),
+        # Cascading an account deletion to its comments
+        Index("ix_comments_author_id", "author_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     post_id = Column(Integer, ForeignKey("posts.id"), nullable=False)
@@ -111,6 +162,11 @@ class Comment(Base):
 
 class Reaction(Base):
     __tablename__ = "reactions"
+    __table_args__ = (
+        # One reaction per user per post; also serves the viewer-reaction lookup
+        UniqueConstraint("post_id", "user_id", name="uq_reactions_post_id_user_id"),
+        Index("ix_reactions_user_id", "user_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     post_id = Column(Integer, ForeignKey("posts.id"), nullable=False)
@@ -121,3 +177,407 @@ class Reaction(Base):
     # Relationships
     post = relationship("Post", back_populates="reactions")
     user = relationship("User", back_populates="reactions")
+
+
+class TimelineEntry(Base):
+    """Materialized home timeline row: ``post_id`` appears in ``user_id``'s feed"""
+
+    __tablename__ = "timeline_entries"
+    __table_args__ = (
+        Index(
+            "ix_timeline_entries_user_created",
+            "user_id",
+            "created_at",
+            "post_id",
+        ),
+        # Removing a deleted post from every timeline
+        Index("ix_timeline_entries_post_id", "post_id"),
+    )
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    post_id = Column(Integer, ForeignKey("posts.id"), primary_key=True)
+    # Copied from the post so a page is a single range scan on the index
+    created_at = Column(DateTime, nullable=False)
+
+
+class MediaBlob(Base):
+    """Stored upload, named after the BLAKE2b digest of its content"""
+
+    __tablename__ = "media_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    url = Column(String, nullable=False, unique=True)
+    digest = Column(String, nullable=False, index=True)
+    size = Column(Integer, nullable=False)
+    # Post image/video URLs and profile pictures pointing at this blob
+    refcount = Column(Integer, nullable=False, default=0, server_default="0")
+    # Last time it was uploaded; unreferenced blobs get a grace period from it
+    uploaded_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class MediaVariant(Base):
+    """Resized rendition of an uploaded image, keyed by the original's URL"""
+
+    __tablename__ = "media_variants"
+    __table_args__ = (
+        UniqueConstraint("source_url", "width", "format", name="uq_media_variants"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_url = Column(String, nullable=False)
+    url = Column(String, nullable=False)
+    width = Column(Integer, nullable=False)
+    format = Column(String, nullable=False)  # webp
+
+
+# Counter maintenance
+#
+# Each insert/delete of a comment, reaction or repost adjusts the matching
+# counter on its post with an atomic UPDATE on the flushing connection, so the
+# counter changes in the same transaction as the row that caused it.
+
+
+def _bump_post_counter(connection, post_id, column, delta):
+    if post_id is None:
+        return
+    posts = Post.__table__
+    connection.execute(
+        update(posts)
+        .where(posts.c.id == post_id)
+        .values({column: posts.c[column] + delta, "version": posts.c.version + 1})
+    )
+
+
+def _touch_post(connection, post_id):
+    posts = Post.__table__
+    connection.execute(
+        update(posts).where(posts.c.id == post_id).values(version=posts.c.version + 1)
+    )
+
+
+@event.listens_for(Comment, "after_insert")
+def _comment_inserted(mapper, connection, target):
+    _bump_post_counter(connection, target.post_id, "comments_count", 1)
+
+
+@event.listens_for(Comment, "after_delete")
+def _comment_deleted(mapper, connection, target):
+    _bump_post_counter(connection, target.post_id, "comments_count", -1)
+
+
+@event.listens_for(Reaction, "after_insert")
+def _reaction_inserted(mapper, connection, target):
+    _bump_post_counter(connection, target.post_id, "reactions_count", 1)
+
+
+@event.listens_for(Reaction, "after_delete")
+def _reaction_deleted(mapper, connection, target):
+    _bump_post_counter(connection, target.post_id, "reactions_count", -1)
+
+
+@event.listens_for(Reaction, "after_update")
+def _reaction_changed(mapper, connection, target):
+    # A changed reaction type leaves the count alone but alters the response
+    _touch_post(connection, target.post_id)
+
+
+@event.listens_for(Post, "after_insert")
+def _repost_inserted(mapper, connection, target):
+    _bump_post_counter(connection, target.original_post_id, "reposts_count", 1)
+
+
+@event.listens_for(Post, "after_delete")
+def _repost_deleted(mapper, connection, target):
+    _bump_post_counter(connection, target.original_post_id, "reposts_count", -1)
+
+
+# User counters work the same way: posts_count follows the author's posts
+# (reposts included) and the follow counts follow edges added or removed
+# through the ``following``/``followers`` collections. Each change also bumps
+# the user's ``version``.
+
+
+def bump_user_counter(connection, user_id, column, delta):
+    """Adjust one of ``user_id``'s counters (for writes that bypass the ORM)"""
+    users = User.__table__
+    connection.execute(
+        update(users)
+        .where(users.c.id == user_id)
+        .values({column: users.c[column] + delta, "version": users.c.version + 1})
+    )
+
+
+def bump_follow_counts(connection, added=(), removed=()):
+    """Adjust follow counts for added/removed (follower_id, followed_id) edges"""
+    for edges, delta in ((added, 1), (removed, -1)):
+        for follower_id, followed_id in edges:
+            bump_user_counter(connection, follower_id, "following_count", delta)
+            bump_user_counter(connection, followed_id, "followers_count", delta)
+
+
+@event.listens_for(Post, "after_insert")
+def _post_inserted(mapper, connection, target):
+    bump_user_counter(connection, target.author_id, "posts_count", 1)
+
+
+@event.listens_for(Post, "after_delete")
+def _post_deleted(mapper, connection, target):
+    bump_user_counter(connection, target.author_id, "posts_count", -1)
+
+
+@event.listens_for(User, "before_delete")
+def _user_edges_released(mapper, connection, target):
+    # The unit of work removes a deleted user's follow rows without an edge
+    # history on the other side, so release their counts here
+    for user in target.following:
+        bump_user_counter(connection, user.id, "followers_count", -1)
+    for user in target.followers:
+        bump_user_counter(connection, user.id, "following_count", -1)
+
+
+# Media reference counting
+#
+# Each post image/video URL and profile picture that points at a stored blob
+# holds a reference on it, adjusted in the same transaction as the change.
+# URLs that are not blobs (seed images, legacy uploads) match no row.
+
+MEDIA_URL_ATTRIBUTES = {Post: ("image_url", "video_url"), User: ("profile_picture",)}
+
+
+def _bump_media_refcount(connection, url, delta):
+    if not url:
+        return
+    blobs = MediaBlob.__table__
+    connection.execute(
+        update(blobs)
+        .where(blobs.c.url == url)
+        .values(refcount=blobs.c.refcount + delta)
+    )
+
+
+def _media_referenced(mapper, connection, target):
+    for name in MEDIA_URL_ATTRIBUTES[mapper.class_]:
+        _bump_media_refcount(connection, getattr(target, name), 1)
+
+
+def _media_released(mapper, connection, target):
+    for name in MEDIA_URL_ATTRIBUTES[mapper.class_]:
+        _bump_media_refcount(connection, getattr(target, name), -1)
+
+
+def _media_reassigned(mapper, connection, target):
+    for name in MEDIA_URL_ATTRIBUTES[mapper.class_]:
+        history = attributes.get_history(target, name)
+        if history.has_changes():
+            for url in history.deleted:
+                _bump_media_refcount(connection, url, -1)
+            for url in history.added:
+                _bump_media_refcount(connection, url, 1)
+
+
+for _model in MEDIA_URL_ATTRIBUTES:
+    event.listen(_model, "after_insert", _media_referenced)
+    event.listen(_model, "after_delete", _media_released)
+    event.listen(_model, "after_update", _media_reassigned)
+
+
+# Home timeline fan-out
+#
+# Posts are written into each follower's ``timeline_entries`` when created,
+# and a followed account's recent posts are backfilled (or pruned) when a
+# follow edge is added (or removed). Accounts with more followers than
+# TIMELINE_CELEBRITY_THRESHOLD (per ``users.followers_count``) are skipped on
+# write; the following feed reads their posts directly instead
+# (fan-out-on-read). The first skip sets ``users.fan_out_on_read``, which
+# stays set if the account later drops below the threshold, so the posts it
+# skipped never vanish from followers' feeds. ``counters.rebuild_timelines``
+# clears it for accounts back under the threshold.
+
+TIMELINE_CELEBRITY_THRESHOLD = int(os.getenv("TIMELINE_CELEBRITY_THRESHOLD", "5000"))
+TIMELINE_BACKFILL_LIMIT = int(os.getenv("TIMELINE_BACKFILL_LIMIT", "200"))
+
+
+def is_celebrity(connection, user_id):
+    """Whether ``user_id``'s posts skip fan-out-on-write (flags them if so)"""
+    users = User.__table__
+    row = connection.execute(
+        select(users.c.followers_count, users.c.fan_out_on_read).where(
+            users.c.id == user_id
+        )
+    ).first()
+    if row is None:
+        return False
+    if row.fan_out_on_read:
+        return True
+    if row.followers_count > TIMELINE_CELEBRITY_THRESHOLD:
+        connection.execute(
+            update(users).where(users.c.id == user_id).values(fan_out_on_read=True)
+        )
+        return True
+    return False
+
+
+def reads_fan_out(users):
+    """SQL condition: posts by ``users`` rows are read rather than fanned out"""
+    return users.c.fan_out_on_read | (
+        users.c.followers_count > TIMELINE_CELEBRITY_THRESHOLD
+    )
+
+
+def fan_out_post(connection, post_id, author_id, created_at):
+    """Insert a new post into the timelines of its author's followers"""
+    if is_celebrity(connection, author_id):
+        return
+    timeline = TimelineEntry.__table__
+    connection.execute(
+        insert(timeline).from_select(
+            ["user_id", "post_id", "created_at"],
+            select(
+                followers.c.follower_id,
+                literal(post_id, Integer),
+                literal(created_at, DateTime),
+            ).where(followers.c.followed_id == author_id),
+        )
+    )
+
+
+def backfill_timeline(connection, user_id, followed_id):
+    """Copy ``followed_id``'s recent posts into ``user_id``'s timeline"""
+    if is_celebrity(connection, followed_id):
+        return
+    posts = Post.__table__
+    timeline = TimelineEntry.__table__
+    recent = (
+        select(literal(user_id, Integer), posts.c.id, posts.c.created_at)
+        .where(
+            posts.c.author_id == followed_id,
+            ~exists().where(
+                and_(timeline.c.user_id == user_id, timeline.c.post_id == posts.c.id)
+            ),
+        )
+        .order_by(posts.c.created_at.desc())
+        .limit(TIMELINE_BACKFILL_LIMIT)
+    )
+    connection.execute(
+        insert(timeline).from_select(["user_id", "post_id", "created_at"], recent)
+    )
+
+
+def prune_timeline(connection, user_id, followed_id):
+    """Remove ``followed_id``'s posts from ``user_id``'s timeline"""
+    posts = Post.__table__
+    timeline = TimelineEntry.__table__
+    connection.execute(
+        delete(timeline).where(
+            timeline.c.user_id == user_id,
+            timeline.c.post_id.in_(
+                select(posts.c.id).where(posts.c.author_id == followed_id)
+            ),
+        )
+    )
+
+
+@event.listens_for(Post, "after_insert")
+def _post_fanned_out(mapper, connection, target):
+    fan_out_post(connection, target.id, target.author_id, target.created_at)
+
+
+@event.listens_for(Post, "before_delete")
+def _post_removed_from_timelines(mapper, connection, target):
+    timeline = TimelineEntry.__table__
+    connection.execute(delete(timeline).where(timeline.c.post_id == target.id))
+
+
+@event.listens_for(User, "before_delete")
+def _user_timeline_removed(mapper, connection, target):
+    timeline = TimelineEntry.__table__
+    connection.execute(delete(timeline).where(timeline.c.user_id == target.id))
+
+
+def _edge_changes(session, forward, backward):
+    """Collect (source_id, target_id) edges added/removed via either side"""
+    added, removed = set(), set()
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, User):
+            continue
+        outgoing = attributes.get_history(
+            obj, forward, attributes.PASSIVE_NO_INITIALIZE
+        )
+        added.update((obj.id, other.id) for other in outgoing.added or ())
+        removed.update((obj.id, other.id) for other in outgoing.deleted or ())
+        incoming = attributes.get_history(
+            obj, backward, attributes.PASSIVE_NO_INITIALIZE
+        )
+        added.update((other.id, obj.id) for other in incoming.added or ())
+        removed.update((other.id, obj.id) for other in incoming.deleted or ())
+    return added - removed, removed - added
+
+
+def _follow_edge_changes(session):
+    """Collect (follower_id, followed_id) edges added/removed via the ORM"""
+    return _edge_changes(session, "following", "followers")
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_timelines_with_follows(session, flush_context):
+    added, removed = _follow_edge_changes(session)
+    if not added and not removed:
+        return
+    connection = session.connection()
+    bump_follow_counts(connection, added, removed)
+    for follower_id, followed_id in added:
+        backfill_timeline(connection, follower_id, followed_id)
+    for follower_id, followed_id in removed:
+        prune_timeline(connection, follower_id, followed_id)
+
+
+# Change versions
+#
+# ``version`` on posts and users only ever increases, whenever something shown
+# in a post or profile response changes: edited columns, counters (which bump
+# it themselves), a reaction's type and follow/block edges (both ends).
+# Conditional GETs (``conditional.py``) build ETags from them without
+# hydrating the response.
+
+
+def bump_user_versions(connection, user_ids, blocks=False):
+    """
+    Bump ``version`` for ``user_ids`` (for writes that bypass the ORM).
+
+    ``blocks=True`` also bumps ``blocks_version``, for block edge changes.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    users = User.__table__
+    values = {"version": users.c.version + 1}
+    if blocks:
+        values["blocks_version"] = users.c.blocks_version + 1
+    connection.execute(update(users).where(users.c.id.in_(user_ids)).values(values))
+
+
+@event.listens_for(Post, "before_update")
+@event.listens_for(User, "before_update")
+def _columns_changed(mapper, connection, target):
+    # Dirty objects reach here for collection changes too; only count
+    # column edits. The SQL expression keeps concurrent bumps from colliding.
+    session = object_session(target)
+    if session is not None and session.is_modified(target, include_collections=False):
+        target.version = mapper.class_.version + 1
+
+
+def _edge_endpoints(session, forward, backward):
+    """IDs of users at either end of an edge added or removed in this flush"""
+    user_ids = set()
+    for edges in _edge_changes(session, forward, backward):
+        for source_id, target_id in edges:
+            user_ids.update((source_id, target_id))
+    return user_ids
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_versions_for_blocks(session, flush_context):
+    # Follow edges bump versions through the follow counts
+    blocked = _edge_endpoints(session, "blocking", "blocked_by")
+    if blocked:
+        bump_user_versions(session.connection(), blocked, blocks=True)
@@ -0,0 +1,125 @@
+"""
+Keyset (cursor) pagination for post and user listings.
+
+Cursors are opaque, URL-safe tokens encoding the ``(created_at, id)`` of the
+last post on a page (or the id of the last user, for follower lists).
+Filtering on that position instead of ``OFFSET`` turns every page into an
+index seek, so deep pages cost the same as the first one.
+
+The list response bodies are unchanged for backward compatibility; the next
+cursor is returned in the ``X-Next-Cursor`` response header.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+
+import models
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode(position: list) -> str:
+    raw = json.dumps(position).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(cursor: str, parse):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return parse(*json.loads(base64.urlsafe_b64decode(padded)))
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+
+def encode_cursor(created_at: datetime, post_id: int) -> str:
+    """Encode a ``(created_at, id)`` position as an opaque cursor"""
+    return _encode([created_at.isoformat(), post_id])
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor produced by ``encode_cursor`` (400 if malformed)"""
+    return _decode(
+        cursor,
+        lambda created_at, post_id: (datetime.fromisoformat(created_at), int(post_id)),
+    )
+
+
+def encode_id_cursor(last_id: int) -> str:
+    """Encode the last id of an id-ordered page as an opaque cursor"""
+    return _encode([last_id])
+
+
+def decode_id_cursor(cursor: str) -> int:
+    """Decode a cursor produced by ``encode_id_cursor`` (400 if malformed)"""
+    return _decode(cursor, int)
+
+
+def paginate_post_ids(
+    query: Query,
+    response: Response,
+    skip: int = 0,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    id_column=models.Post.id,
+    created_at_column=models.Post.created_at,
+) -> List[int]:
+    """
+    Return one page of post IDs from ``query`` (newest first).
+
+    ``query`` must select ``id`` and ``created_at`` columns, which default to
+    ``models.Post``'s; pass ``id_column``/``created_at_column`` when paging
+    another source such as the timeline table. When ``cursor`` is given it
+    takes precedence over ``skip``. If the page is full, the cursor for the
+    following page is set on ``response``.
+    """
+    if cursor:
+        created_at, post_id = decode_cursor(cursor)
+        query = query.filter(
+            or_(
+                created_at_column < created_at,
+                and_(created_at_column == created_at, id_column < post_id),
+            )
+        )
+
+    query = query.order_by(created_at_column.desc(), id_column.desc())
+    if skip and not cursor:
+        query = query.offset(skip)
+    rows = query.limit(limit).all()
+
+    if rows and len(rows) == limit:
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.created_at, last.id)
+
+    return [row.id for row in rows]
+
+
+def paginate_by_id(
+    query: Query,
+    response: Response,
+    id_column,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+) -> List:
+    """
+    Return one page of rows from ``query`` in ascending ``id_column`` order.
+
+    ``query`` must select the same value as a column labelled ``id``. If the
+    page is full, the cursor for the following page is set on ``response``.
+    """
+    if cursor:
+        query = query.filter(id_column > decode_id_cursor(cursor))
+    rows = query.order_by(id_column).limit(limit).all()
+
+    if rows and len(rows) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_id_cursor(rows[-1].id)
+
+    return rows
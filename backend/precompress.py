@@ -0,0 +1,57 @@
+"""
+Build step: write precompressed siblings for frontend assets.
+
+For every JS, CSS, HTML, SVG and JSON file under the directory, writes
+``<file>.gz`` (gzip level 9) and, when the optional ``brotli`` package is
+installed, ``<file>.br`` (quality 11). The frontend static handler serves them
+according to ``Accept-Encoding``, so nothing is compressed at request time.
+Siblings that would not be smaller than the original are not written.
+
+Usage:
+    python precompress.py [directory]    # default: frontend-dist
+"""
+
+import gzip
+import sys
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+PRECOMPRESSED_EXTENSIONS = {".js", ".mjs", ".css", ".html", ".svg", ".json"}
+
+
+def _compressors():
+    # mtime=0 keeps the output byte-identical across builds
+    yield ".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield ".br", lambda data: brotli.compress(data, quality=11)
+
+
+def precompress(directory: Path) -> int:
+    """Write compressed siblings under ``directory``; returns files written"""
+    written = 0
+    for path in sorted(Path(directory).rglob("*")):
+        if not path.is_file() or path.suffix not in PRECOMPRESSED_EXTENSIONS:
+            continue
+        data = path.read_bytes()
+        for suffix, compress in _compressors():
+            compressed = compress(data)
+            sibling = path.with_name(path.name + suffix)
+            if len(compressed) < len(data):
+                sibling.write_bytes(compressed)
+                written += 1
+            elif sibling.exists():
+                sibling.unlink()
+    return written
+
+
+if __name__ == "__main__":
+    target = Path(sys.argv[1] if len(sys.argv) > 1 else "frontend-dist")
+    if not target.is_dir():
+        sys.exit(f"{target} is not a directory")
+    count = precompress(target)
+    encodings = "gzip and brotli" if brotli is not None else "gzip"
+    print(f"Wrote {count} precompressed files ({encodings}) under {target}")
@@ -0,0 +1,87 @@
+"""
+Follow and block edge writes.
+
+Each change is one idempotent statement on the association table (``INSERT
+... ON CONFLICT DO NOTHING`` or ``DELETE``) that reports whether a row
+changed, so checking and writing an edge costs the same however many
+accounts a user follows. Statements run on the session's connection,
+bypassing the ORM listeners in ``models.py``, so the home timeline, counters
+and versions are updated here explicitly. Call ``events.publish`` after
+committing.
+"""
+
+from sqlalchemy import delete, exists, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+from database import mark_written
+
+_UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _insert_edge(db: Session, table, source_id: int, target_id: int) -> bool:
+    source, target = table.primary_key.columns
+    values = {source.name: source_id, target.name: target_id}
+    connection = db.connection()
+    upsert = _UPSERT_DIALECTS.get(connection.dialect.name)
+    if upsert is not None:
+        statement = upsert(table).values(values).on_conflict_do_nothing()
+    else:
+        statement = insert(table).from_select(
+            list(values),
+            select(literal(source_id), literal(target_id)).where(
+                ~exists().where(source == source_id, target == target_id)
+            ),
+        )
+    return connection.execute(statement).rowcount == 1
+
+
+def _delete_edge(db: Session, table, source_id: int, target_id: int) -> bool:
+    source, target = table.primary_key.columns
+    result = db.connection().execute(
+        delete(table).where(source == source_id, target == target_id)
+    )
+    return result.rowcount == 1
+
+
+def follow(db: Session, follower_id: int, followed_id: int) -> bool:
+    """Add a follow edge; returns False if it already existed"""
+    if not _insert_edge(db, models.followers, follower_id, followed_id):
+        return False
+    connection = db.connection()
+    models.bump_follow_counts(connection, added=[(follower_id, followed_id)])
+    models.backfill_timeline(connection, follower_id, followed_id)
+    mark_written(db)
+    return True
+
+
+def unfollow(db: Session, follower_id: int, followed_id: int) -> bool:
+    """Remove a follow edge; returns False if there was none"""
+    if not _delete_edge(db, models.followers, follower_id, followed_id):
+        return False
+    connection = db.connection()
+    models.bump_follow_counts(connection, removed=[(follower_id, followed_id)])
+    models.prune_timeline(connection, follower_id, followed_id)
+    mark_written(db)
+    return True
+
+
+def block(db: Session, blocker_id: int, blocked_id: int) -> bool:
+    """Add a block edge, dropping follows either way; False if already blocked"""
+    if not _insert_edge(db, models.blocks, blocker_id, blocked_id):
+        return False
+    unfollow(db, blocker_id, blocked_id)
+    unfollow(db, blocked_id, blocker_id)
+    models.bump_user_versions(db.connection(), [blocker_id, blocked_id], blocks=True)
+    mark_written(db)
+    return True
+
+
+def unblock(db: Session, blocker_id: int, blocked_id: int) -> bool:
+    """Remove a block edge; returns False if there was none"""
+    if not _delete_edge(db, models.blocks, blocker_id, blocked_id):
+        return False
+    models.bump_user_versions(db.connection(), [blocker_id, blocked_id], blocks=True)
+    mark_written(db)
+    return True
@@ -0,0 +1,105 @@
+"""
+Async variants of the hottest read endpoints.
+
+Mounted in place of the sync routes when ``ASYNC_DATABASE=true``. Each
+handler awaits the async engine instead of occupying a threadpool worker for
+the whole request, so concurrent feed/profile/post reads are bounded by the
+connection pool rather than the ~40 sync handler threads.
+
+The query and hydration logic is shared with the sync routers: it runs on
+the session's sync facade through ``AsyncSession.run_sync``, so both paths
+return identical responses.
+"""
+
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import schemas
+from auth import get_current_user_async, get_optional_user_async
+from database import get_async_db
+from routers import feed, posts, users
+
+router = APIRouter()
+
+
+@router.get("/feed/all", response_model=List[schemas.PostResponse], tags=["Feed"])
+async def get_all_feed(
+    response: Response,
+    skip: int = 0,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user: models.User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get all posts from all users (excluding blocked users)"""
+    return await db.run_sync(
+        lambda session: feed.get_all_feed(
+            response,
+            skip,
+            limit,
+            cursor,
+            if_none_match,
+            current_user=current_user,
+            db=session,
+        )
+    )
+
+
+@router.get("/feed/following", response_model=List[schemas.PostResponse], tags=["Feed"])
+async def get_following_feed(
+    response: Response,
+    skip: int = 0,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user: models.User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get posts from users you follow"""
+    return await db.run_sync(
+        lambda session: feed.get_following_feed(
+            response,
+            skip,
+            limit,
+            cursor,
+            if_none_match,
+            current_user=current_user,
+            db=session,
+        )
+    )
+
+
+@router.get(
+    "/users/{username}", response_model=schemas.UserProfileResponse, tags=["Users"]
+)
+async def get_user_profile(
+    username: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user_async),
+):
+    """Get user profile by username"""
+    return await db.run_sync(
+        lambda session: users.get_user_profile(
+            username, response, if_none_match, db=session, current_user=current_user
+        )
+    )
+
+
+@router.get(
+    "/posts/{post_id}", response_model=schemas.PostDetailResponse, tags=["Posts"]
+)
+async def get_post(
+    post_id: int,
+    current_user: Optional[models.User] = Depends(get_optional_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get a single post with all details (public endpoint)"""
+    return await db.run_sync(
+        lambda session: posts.get_post(post_id, current_user=current_user, db=session)
+    )
@@ -1,6 +1,7 @@
 import os
 
 from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from sqlalchemy.orm import Session
@@ -10,8 +11,8 @@ import schemas
 from auth import (
     create_access_token,
     get_current_user,
-    get_password_hash,
-    verify_password,
+    get_password_hash_async,
+    verify_password_async,
 )
 from database import get_db
 
@@ -34,35 +35,18 @@ REGISTER_RATE = "500/minute" if TESTING_MODE else "15/minute"
     status_code=status.HTTP_201_CREATED,
 )
 @limiter.limit(REGISTER_RATE)
-def register(
+async def register(
     request: Request, user_data: schemas.UserCreate, db: Session = Depends(get_db)
 ):
-    """Register a new user and return access token (rate limited: 15/min prod, 500/min test)"""
-    # Check if email already exists
-    if db.query(models.User).filter(models.User.email == user_data.email).first():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered"
-        )
+    """Register a new user and return access token (rate limited: 15/min prod, 500/min test)
 
-    # Check if username already exists
-    if db.query(models.User).filter(models.User.username == user_data.username).first():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Username already taken"
-        )
+    Password hashing runs on the bcrypt worker pool; returns 503 when it is saturated.
+    """
+    await run_in_threadpool(_ensure_user_available, db, user_data)
 
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
-    new_user = models.User(
-        email=user_data.email,
-        username=user_data.username,
-        display_name=user_data.display_name,
-        hashed_password=hashed_password,
-        bio=user_data.bio or "",
-    )
-
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    hashed_password = await get_password_hash_async(user_data.password)
+    new_user = await run_in_threadpool(_create_user, db, user_data, hashed_password)
 
     # Create access token for immediate login
     access_token = create_access_token(data={"sub": new_user.email})
@@ -77,13 +61,19 @@ def register(
 
 @router.post("/login", response_model=schemas.Token)
 @limiter.limit(LOGIN_RATE)
-def login(
+async def login(
     request: Request, login_data: schemas.LoginRequest, db: Session = Depends(get_db)
 ):
-    """Login with email and password (rate limited: 20/min prod, 1000/min test)"""
-    user = db.query(models.User).filter(models.User.email == login_data.email).first()
+    """Login with email and password (rate limited: 20/min prod, 1000/min test)
 
-    if not user or not verify_password(login_data.password, user.hashed_password):
+    Password verification runs on the bcrypt worker pool; returns 503 when it is
+    saturated.
+    """
+    user = await run_in_threadpool(_get_user_by_email, db, login_data.email)
+
+    if not user or not await verify_password_async(
+        login_data.password, user.hashed_password
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -94,14 +84,50 @@ def login(
     return schemas.Token(access_token=access_token, token_type="bearer")
 
 
+# Database helpers for the async handlers above; run in the threadpool so the
+# blocking session calls stay off the event loop
+
+
+def _get_user_by_email(db: Session, email: str):
+    return db.query(models.User).filter(models.User.email == email).first()
+
+
+def _ensure_user_available(db: Session, user_data: schemas.UserCreate) -> None:
+    # Check if email already exists
+    if _get_user_by_email(db, user_data.email):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered"
+        )
+
+    # Check if username already exists
+    if db.query(models.User).filter(models.User.username == user_data.username).first():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Username already taken"
+        )
+
+
+def _create_user(
+    db: Session, user_data: schemas.UserCreate, hashed_password: str
+) -> models.User:
+    new_user = models.User(
+        email=user_data.email,
+        username=user_data.username,
+        display_name=user_data.display_name,
+        hashed_password=hashed_password,
+        bio=user_data.bio or "",
+    )
+
+    db.add(new_user)
+    db.commit()
+    db.refresh(new_user)
+    return new_user
+
+
 @router.get("/me", response_model=schemas.UserResponse)
 def get_current_user_info(
     current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)
 ):
     """Get current authenticated user info"""
-    followers_count = len(current_user.followers)
-    following_count = len(current_user.following)
-
     return schemas.UserResponse(
         id=current_user.id,
         email=current_user.email,
@@ -112,8 +138,8 @@ def get_current_user_info(
         theme=current_user.theme,
         text_density=current_user.text_density,
         created_at=current_user.created_at,
-        followers_count=followers_count,
-        following_count=following_count,
+        followers_count=current_user.followers_count,
+        following_count=current_user.following_count,
         is_following=False,
         is_blocked=False,
     )
@@ -4,6 +4,8 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 import models
+from auth import user_cache
+from blocking import blocked_ids_cache
 from database import engine, get_db
 from seed import seed_database
 
@@ -41,6 +43,11 @@ def reset_database(db: Session = Depends(get_db), _: bool = Depends(require_test
     # Reseed database
     seed_database()
 
+    # Cached users and block sets describe the dropped rows, and the new
+    # rows reuse their ids and versions
+    user_cache.clear()
+    blocked_ids_cache.clear()
+
     return {"message": "Database reset successfully"}
 
 
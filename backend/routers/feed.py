@@ -1,171 +1,165 @@
-from typing import List, Optional, Set
-
-from fastapi import APIRouter, Depends
+import asyncio
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 import models
 import schemas
 from auth import get_current_user
+from blocking import blocked_user_ids, not_blocked
+from conditional import check_not_modified, feed_etag
 from database import get_db
+from events import RESYNC, StreamAudience, format_sse, get_event_bus
+from hydration import hydrate_posts
+from pagination import paginate_post_ids
+from serialization import model_response
 
 router = APIRouter()
 
+# Comment lines sent on idle streams so proxies don't time them out
+FEED_STREAM_HEARTBEAT_SECONDS = float(os.getenv("FEED_STREAM_HEARTBEAT_SECONDS", "15"))
+
 
 @router.get("/all", response_model=List[schemas.PostResponse])
 def get_all_feed(
+    response: Response,
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    """Get all posts from all users (excluding blocked users)"""
-    blocked_user_ids = _get_all_blocked_user_ids(current_user)
-
-    # Get all posts excluding blocked users
-    query = db.query(models.Post)
-    if blocked_user_ids:
-        query = query.filter(~models.Post.author_id.in_(blocked_user_ids))
-
-    posts = (
-        query.order_by(models.Post.created_at.desc()).offset(skip).limit(limit).all()
+    """Get all posts from all users (excluding blocked users)
+
+    Pass the ``X-Next-Cursor`` response header back as ``cursor`` to fetch the
+    next page with keyset pagination; ``skip`` is kept for compatibility.
+    Send the ``ETag`` back as ``If-None-Match`` to get a 304 if unchanged.
+    """
+    # Get all post IDs excluding blocked users
+    query = db.query(models.Post.id, models.Post.created_at).filter(
+        not_blocked(current_user.id, models.Post.author_id)
     )
 
-    if blocked_user_ids:
-        posts = [post for post in posts if post.author_id not in blocked_user_ids]
+    post_ids = paginate_post_ids(query, response, skip, limit, cursor)
+    etag = feed_etag(db, current_user.id, post_ids, "all", skip, limit, cursor)
+    not_modified = check_not_modified(response, etag, if_none_match)
+    if not_modified:
+        return not_modified
 
-    return _format_posts(posts, current_user, db, blocked_user_ids)
+    # The block set only hides blocked originals inside reposts
+    blocked_ids = blocked_user_ids(db, current_user.id)
+    return model_response(
+        hydrate_posts(db, post_ids, current_user, blocked_ids), response
+    )
 
 
 @router.get("/following", response_model=List[schemas.PostResponse])
 def get_following_feed(
+    response: Response,
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    """Get posts from users you follow"""
-    # Get following user IDs
-    following_ids = [user.id for user in current_user.following]
-    blocked_user_ids = _get_all_blocked_user_ids(current_user)
-
-    if not following_ids:
-        return []
-
-    # Get posts from following
-    posts = (
-        db.query(models.Post)
-        .filter(models.Post.author_id.in_(following_ids))
-        .order_by(models.Post.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
+    """Get posts from users you follow
+
+    Reads the viewer's materialized timeline (filled on write), merged with
+    posts from followed accounts too large for fan-out-on-write.
+    """
+    timeline = models.TimelineEntry
+    entries = (
+        db.query(timeline.post_id.label("id"), timeline.created_at.label("created_at"))
+        .join(models.Post, models.Post.id == timeline.post_id)
+        .filter(
+            timeline.user_id == current_user.id,
+            not_blocked(current_user.id, models.Post.author_id),
+        )
     )
-
-    if blocked_user_ids:
-        posts = [post for post in posts if post.author_id not in blocked_user_ids]
-
-    return _format_posts(posts, current_user, db, blocked_user_ids)
-
-
-def _format_posts(
-    posts: List[models.Post],
-    current_user: models.User,
-    db: Session,
-    blocked_user_ids: Optional[Set[int]] = None,
-) -> List[schemas.PostResponse]:
-    """Helper function to format posts for response"""
-    result = []
-
-    for post in posts:
-        if blocked_user_ids and post.author_id in blocked_user_ids:
-            continue
-
-        # Get counts
-        comments_count = len(post.comments)
-        reactions_count = len(post.reactions)
-        reposts_count = (
-            db.query(models.Post)
-            .filter(models.Post.original_post_id == post.id)
-            .count()
+    id_column, created_at_column = timeline.post_id, timeline.created_at
+
+    celebrity_ids = _followed_celebrity_ids(db, current_user.id)
+    if celebrity_ids:
+        celebrity_posts = db.query(
+            models.Post.id.label("id"), models.Post.created_at.label("created_at")
+        ).filter(
+            models.Post.author_id.in_(celebrity_ids),
+            not_blocked(current_user.id, models.Post.author_id),
         )
+        merged = entries.union(celebrity_posts).subquery()
+        entries = db.query(merged.c.id, merged.c.created_at)
+        id_column, created_at_column = merged.c.id, merged.c.created_at
 
-        # Check user reaction
-        user_reaction = None
-        for reaction in post.reactions:
-            if reaction.user_id == current_user.id:
-                user_reaction = reaction.reaction_type
-                break
-
-        # Check if user has reposted
-        has_reposted = (
-            db.query(models.Post)
-            .filter(
-                models.Post.author_id == current_user.id,
-                models.Post.original_post_id == post.id,
-            )
-            .first()
-            is not None
-        )
+    post_ids = paginate_post_ids(
+        entries, response, skip, limit, cursor, id_column, created_at_column
+    )
+    etag = feed_etag(db, current_user.id, post_ids, "following", skip, limit, cursor)
+    not_modified = check_not_modified(response, etag, if_none_match)
+    if not_modified:
+        return not_modified
+
+    blocked_ids = blocked_user_ids(db, current_user.id)
+    return model_response(
+        hydrate_posts(db, post_ids, current_user, blocked_ids), response
+    )
 
-        # Handle original post for reposts
-        original_post = None
-        if post.is_repost and post.original_post:
-            orig = post.original_post
-            if blocked_user_ids and orig.author_id in blocked_user_ids:
-                orig = None
-
-            original_post = (
-                schemas.PostResponse(
-                    id=orig.id,
-                    content=orig.content,
-                    image_url=orig.image_url,
-                    video_url=orig.video_url,
-                    is_repost=False,
-                    original_post_id=None,
-                    original_post=None,
-                    author_id=orig.author_id,
-                    author_username=orig.author.username,
-                    author_display_name=orig.author.display_name,
-                    author_profile_picture=orig.author.profile_picture,
-                    created_at=orig.created_at,
-                    comments_count=len(orig.comments),
-                    reactions_count=len(orig.reactions),
-                    reposts_count=db.query(models.Post)
-                    .filter(models.Post.original_post_id == orig.id)
-                    .count(),
-                    user_reaction=None,
-                    has_reposted=False,
-                )
-                if orig
-                else None
-            )
-
-        result.append(
-            schemas.PostResponse(
-                id=post.id,
-                content=post.content,
-                image_url=post.image_url,
-                video_url=post.video_url,
-                is_repost=post.is_repost,
-                original_post_id=post.original_post_id,
-                original_post=original_post,
-                author_id=post.author_id,
-                author_username=post.author.username,
-                author_display_name=post.author.display_name,
-                author_profile_picture=post.author.profile_picture,
-                created_at=post.created_at,
-                comments_count=comments_count,
-                reactions_count=reactions_count,
-                reposts_count=reposts_count,
-                user_reaction=user_reaction,
-                has_reposted=has_reposted,
-            )
-        )
 
-    return result
+@router.get("/stream")
+async def stream_feed(
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Live updates for the following feed as Server-Sent Events
+
+    Sends ``post``, ``repost``, ``reaction`` and ``comment`` events for posts
+    by the viewer and accounts they follow (minus blocked users). A
+    ``resync`` event means updates were dropped and the feed should be
+    refetched.
+    """
+    return StreamingResponse(
+        _feed_events(current_user.id, db.get_bind()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
-def _get_all_blocked_user_ids(user: models.User) -> Set[int]:
-    blocked_ids = {blocked_user.id for blocked_user in user.blocking}
-    blocked_by_ids = {blocking_user.id for blocking_user in user.blocked_by}
-    return blocked_ids.union(blocked_by_ids)
+async def _feed_events(viewer_id: int, bind):
+    bus = get_event_bus()
+    # Subscribe before reading the follow graph so no event falls in between
+    queue = bus.subscribe()
+    try:
+        audience = await run_in_threadpool(StreamAudience.load, bind, viewer_id)
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    queue.get(), FEED_STREAM_HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if audience.needs_reload(event):
+                audience = await run_in_threadpool(StreamAudience.load, bind, viewer_id)
+            elif event is RESYNC or audience.allows(event):
+                yield format_sse(event)
+    finally:
+        # Runs when the client disconnects and the stream is cancelled
+        bus.unsubscribe(queue)
+
+
+def _followed_celebrity_ids(db: Session, user_id: int) -> List[int]:
+    """IDs of accounts ``user_id`` follows that skip fan-out-on-write"""
+    followers = models.followers
+    users = models.User.__table__
+    return db.scalars(
+        select(users.c.id)
+        .join(followers, followers.c.followed_id == users.c.id)
+        .where(followers.c.follower_id == user_id, models.reads_fan_out(users))
+    ).all()
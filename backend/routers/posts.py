@@ -1,26 +1,39 @@
-import uuid
 from pathlib import Path
 from typing import Optional
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    File,
+    HTTPException,
+    UploadFile,
+    status,
+)
 from sqlalchemy.orm import Session
 
+import events
+import media
 import models
 import schemas
 from auth import get_current_user, get_optional_user
+from blocking import blocked_user_ids
 from database import get_db
+from hydration import build_post_response, hydrate_posts
+from media import image_srcsets
 
 router = APIRouter()
 
-# Directory for uploaded files
-UPLOAD_DIR = Path(__file__).parent.parent / "static" / "uploads"
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+# Uploaded files live in the content-addressed store (media.UPLOAD_DIR)
+media.UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 
 @router.post("/upload")
 async def upload_media(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
 ):
     """Upload an image or video file"""
     # Validate file type
@@ -42,20 +55,20 @@ async def upload_media(
             detail=f"File type not allowed. Allowed types: {', '.join(allowed_extensions)}",
         )
 
-    # Generate unique filename
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = UPLOAD_DIR / unique_filename
-
-    # Save file
+    # Save file (streamed in chunks; content must match the extension).
+    # Identical content is stored once and shared.
     try:
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
+        file_url, stored = await media.store_upload(db, file, file_ext)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
 
-    # Return the URL
-    file_url = f"/static/uploads/{unique_filename}"
+    # Resized variants are generated after the response (once per content)
+    if stored.created:
+        background_tasks.add_task(
+            media.process_image, file_url, stored.path, db.get_bind()
+        )
     return {"url": file_url, "filename": file.filename}
 
 
@@ -77,8 +90,11 @@ def create_post(
     )
 
     db.add(new_post)
+    db.flush()
+    media.require_blobs(db, [new_post.image_url, new_post.video_url])
     db.commit()
     db.refresh(new_post)
+    events.publish("post", current_user.id, current_user.id, post_id=new_post.id)
 
     return schemas.PostResponse(
         id=new_post.id,
@@ -119,13 +135,21 @@ def update_post(
         )
 
     # Update post content
+    released, attached = [], []
     post.content = post_data.content
-    if post_data.image_url is not None:
+    if post_data.image_url is not None and post_data.image_url != post.image_url:
+        released.append(post.image_url)
+        attached.append(post_data.image_url)
         post.image_url = post_data.image_url
-    if post_data.video_url is not None:
+    if post_data.video_url is not None and post_data.video_url != post.video_url:
+        released.append(post.video_url)
+        attached.append(post_data.video_url)
         post.video_url = post_data.video_url
 
+    db.flush()
+    media.require_blobs(db, attached)
     db.commit()
+    media.collect_garbage(db, released)
     db.refresh(post)
 
     return _format_single_post(post, current_user, db)
@@ -198,28 +222,21 @@ def create_repost(
     db.add(new_repost)
     db.commit()
     db.refresh(new_repost)
+    events.publish(
+        "repost",
+        current_user.id,
+        current_user.id,
+        post_id=new_repost.id,
+        original_post_id=original_post.id,
+    )
 
     # Prepare original post response
-    original_post_response = schemas.PostResponse(
-        id=original_post.id,
-        content=original_post.content,
-        image_url=original_post.image_url,
-        video_url=original_post.video_url,
-        is_repost=False,
-        original_post_id=None,
-        original_post=None,
-        author_id=original_post.author_id,
-        author_username=original_post.author.username,
-        author_display_name=original_post.author.display_name,
-        author_profile_picture=original_post.author.profile_picture,
-        created_at=original_post.created_at,
-        comments_count=len(original_post.comments),
-        reactions_count=len(original_post.reactions),
-        reposts_count=db.query(models.Post)
-        .filter(models.Post.original_post_id == original_post.id)
-        .count(),
-        user_reaction=None,
-        has_reposted=False,
+    original_post_response = build_post_response(
+        original_post,
+        embedded=True,
+        image_srcset=image_srcsets(db, [original_post.image_url]).get(
+            original_post.image_url
+        ),
     )
 
     return schemas.PostResponse(
@@ -259,8 +276,10 @@ def delete_post(
             status_code=403, detail="Not authorized to delete this post"
         )
 
+    released = [post.image_url, post.video_url]
     db.delete(post)
     db.commit()
+    media.collect_garbage(db, released)
 
     return {"message": "Post deleted successfully"}
 
@@ -277,9 +296,7 @@ def get_post(
         raise HTTPException(status_code=404, detail="Post not found")
 
     # Check if blocked (only if user is authenticated)
-    if current_user and (
-        post.author in current_user.blocking or current_user in post.author.blocking
-    ):
+    if current_user and post.author_id in blocked_user_ids(db, current_user.id):
         raise HTTPException(status_code=403, detail="Cannot view this post")
 
     # Get user reaction (only if authenticated)
@@ -334,35 +351,19 @@ def get_post(
         )
 
     # Handle original post for reposts
+    original = post.original_post if post.is_repost else None
+    srcsets = image_srcsets(db, [post.image_url, original and original.image_url])
     original_post = None
-    if post.is_repost and post.original_post:
-        orig = post.original_post
-        original_post = schemas.PostResponse(
-            id=orig.id,
-            content=orig.content,
-            image_url=orig.image_url,
-            video_url=orig.video_url,
-            is_repost=False,
-            original_post_id=None,
-            original_post=None,
-            author_id=orig.author_id,
-            author_username=orig.author.username,
-            author_display_name=orig.author.display_name,
-            author_profile_picture=orig.author.profile_picture,
-            created_at=orig.created_at,
-            comments_count=len(orig.comments),
-            reactions_count=len(orig.reactions),
-            reposts_count=db.query(models.Post)
-            .filter(models.Post.original_post_id == orig.id)
-            .count(),
-            user_reaction=None,
-            has_reposted=False,
+    if original:
+        original_post = build_post_response(
+            original, embedded=True, image_srcset=srcsets.get(original.image_url)
         )
 
     return schemas.PostDetailResponse(
         id=post.id,
         content=post.content,
         image_url=post.image_url,
+        image_srcset=srcsets.get(post.image_url),
         video_url=post.video_url,
         is_repost=post.is_repost,
         original_post_id=post.original_post_id,
@@ -372,11 +373,9 @@ def get_post(
         author_display_name=post.author.display_name,
         author_profile_picture=post.author.profile_picture,
         created_at=post.created_at,
-        comments_count=len(post.comments),
-        reactions_count=len(post.reactions),
-        reposts_count=db.query(models.Post)
-        .filter(models.Post.original_post_id == post.id)
-        .count(),
+        comments_count=post.comments_count,
+        reactions_count=post.reactions_count,
+        reposts_count=post.reposts_count,
         user_reaction=user_reaction,
         has_reposted=has_reposted,
         comments=comments,
@@ -407,6 +406,14 @@ def create_comment(
     db.add(new_comment)
     db.commit()
     db.refresh(new_comment)
+    events.publish(
+        "comment",
+        post.author_id,
+        current_user.id,
+        post_id=post_id,
+        comment_id=new_comment.id,
+        comments_count=post.comments_count,
+    )
 
     return schemas.CommentResponse(
         id=new_comment.id,
@@ -464,6 +471,14 @@ def add_reaction(
 
     # Return full post with updated reaction state
     db.refresh(post)
+    events.publish(
+        "reaction",
+        post.author_id,
+        current_user.id,
+        post_id=post_id,
+        reaction_type=reaction_data.reaction_type,
+        reactions_count=post.reactions_count,
+    )
     return _format_single_post(post, current_user, db)
 
 
@@ -495,6 +510,14 @@ def remove_reaction(
 
     # Return full post with updated reaction state
     db.refresh(post)
+    events.publish(
+        "reaction",
+        post.author_id,
+        current_user.id,
+        post_id=post_id,
+        reaction_type=None,
+        reactions_count=post.reactions_count,
+    )
     return _format_single_post(post, current_user, db)
 
 
@@ -502,73 +525,4 @@ def _format_single_post(
     post: models.Post, current_user: models.User, db: Session
 ) -> schemas.PostResponse:
     """Helper function to format a single post for response"""
-    # Get counts
-    comments_count = len(post.comments)
-    reactions_count = len(post.reactions)
-    reposts_count = (
-        db.query(models.Post).filter(models.Post.original_post_id == post.id).count()
-    )
-
-    # Check user reaction
-    user_reaction = None
-    for reaction in post.reactions:
-        if reaction.user_id == current_user.id:
-            user_reaction = reaction.reaction_type
-            break
-
-    # Check if user has reposted
-    has_reposted = (
-        db.query(models.Post)
-        .filter(
-            models.Post.author_id == current_user.id,
-            models.Post.original_post_id == post.id,
-        )
-        .first()
-        is not None
-    )
-
-    # Handle original post for reposts
-    original_post = None
-    if post.is_repost and post.original_post:
-        orig = post.original_post
-        original_post = schemas.PostResponse(
-            id=orig.id,
-            content=orig.content,
-            image_url=orig.image_url,
-            video_url=orig.video_url,
-            is_repost=False,
-            original_post_id=None,
-            original_post=None,
-            author_id=orig.author_id,
-            author_username=orig.author.username,
-            author_display_name=orig.author.display_name,
-            author_profile_picture=orig.author.profile_picture,
-            created_at=orig.created_at,
-            comments_count=len(orig.comments),
-            reactions_count=len(orig.reactions),
-            reposts_count=db.query(models.Post)
-            .filter(models.Post.original_post_id == orig.id)
-            .count(),
-            user_reaction=None,
-            has_reposted=False,
-        )
-
-    return schemas.PostResponse(
-        id=post.id,
-        content=post.content,
-        image_url=post.image_url,
-        video_url=post.video_url,
-        is_repost=post.is_repost,
-        original_post_id=post.original_post_id,
-        original_post=original_post,
-        author_id=post.author_id,
-        author_username=post.author.username,
-        author_display_name=post.author.display_name,
-        author_profile_picture=post.author.profile_picture,
-        created_at=post.created_at,
-        comments_count=comments_count,
-        reactions_count=reactions_count,
-        reposts_count=reposts_count,
-        user_reaction=user_reaction,
-        has_reposted=has_reposted,
-    )
+    return hydrate_posts(db, [post.id], current_user)[0]
@@ -1,98 +1,185 @@
-import uuid
 from pathlib import Path
-from typing import List
-
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from typing import List, Optional
+
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    File,
+    Header,
+    HTTPException,
+    Response,
+    UploadFile,
+)
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, exists, or_
 from sqlalchemy.orm import Session
 
+import events
+import media
 import models
+import relationships
 import schemas
-from auth import get_current_user
+from auth import get_current_user, invalidate_cached_user
+from blocking import blocked_user_ids
+from conditional import check_not_modified, profile_etag
 from database import get_db
+from hydration import hydrate_posts
+from media import delete_derivatives
+from pagination import paginate_by_id, paginate_post_ids
+from serialization import model_response
 
 router = APIRouter()
 
-# Directory for uploaded profile pictures
-UPLOAD_DIR = Path(__file__).parent.parent / "static" / "uploads" / "avatars"
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+# Profile pictures uploaded before content-addressed storage (media.py)
+LEGACY_AVATAR_DIR = Path(__file__).parent.parent / "static" / "uploads" / "avatars"
+
+
+def _relationship_list(
+    db: Session,
+    response: Response,
+    viewer_id: int,
+    user_id: int,
+    listed_column,
+    owner_column,
+    limit: int,
+    cursor: Optional[str],
+) -> List[schemas.UserListItem]:
+    """
+    One page of users on the ``listed_column`` side of ``user_id``'s edges.
+
+    ``is_following`` and ``is_blocked`` come from LEFT JOINs against the
+    viewer's own follow and block edges, so a page is a single statement.
+    """
+    followers, blocks = models.followers, models.blocks
+    User = models.User
+    viewer_follows = followers.alias("viewer_follows")
+    blocked = blocks.alias("blocked")
+    blocked_by = blocks.alias("blocked_by")
+    query = (
+        db.query(
+            User.id,
+            User.username,
+            User.display_name,
+            User.bio,
+            User.profile_picture,
+            viewer_follows.c.follower_id.is_not(None).label("is_following"),
+            or_(
+                blocked.c.blocker_id.is_not(None),
+                blocked_by.c.blocker_id.is_not(None),
+            ).label("is_blocked"),
+        )
+        .select_from(followers)
+        .join(User, User.id == listed_column)
+        .outerjoin(
+            viewer_follows,
+            and_(
+                viewer_follows.c.follower_id == viewer_id,
+                viewer_follows.c.followed_id == User.id,
+            ),
+        )
+        .outerjoin(
+            blocked,
+            and_(blocked.c.blocker_id == viewer_id, blocked.c.blocked_id == User.id),
+        )
+        .outerjoin(
+            blocked_by,
+            and_(
+                blocked_by.c.blocker_id == User.id,
+                blocked_by.c.blocked_id == viewer_id,
+            ),
+        )
+        .filter(owner_column == user_id)
+    )
+    rows = paginate_by_id(query, response, listed_column, limit, cursor)
+    return [schemas.UserListItem(**row._mapping) for row in rows]
 
 
 @router.get("/{username}/followers", response_model=List[schemas.UserListItem])
 def get_followers(
     username: str,
+    response: Response,
+    limit: int = 50,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    """Get list of users who follow this user"""
+    """Get a page of users who follow this user (``X-Next-Cursor`` for more)"""
     user = db.query(models.User).filter(models.User.username == username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    followers = []
-    for follower in user.followers:
-        followers.append(
-            schemas.UserListItem(
-                id=follower.id,
-                username=follower.username,
-                display_name=follower.display_name,
-                bio=follower.bio,
-                profile_picture=follower.profile_picture,
-                is_following=follower in current_user.following,
-                is_blocked=follower in current_user.blocking
-                or current_user in follower.blocking,
-            )
-        )
-
-    return followers
+    followers = models.followers
+    page = _relationship_list(
+        db,
+        response,
+        current_user.id,
+        user.id,
+        followers.c.follower_id,
+        followers.c.followed_id,
+        limit,
+        cursor,
+    )
+    return model_response(page, response)
 
 
 @router.get("/{username}/following", response_model=List[schemas.UserListItem])
 def get_following(
     username: str,
+    response: Response,
+    limit: int = 50,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    """Get list of users this user is following"""
+    """Get a page of users this user is following (``X-Next-Cursor`` for more)"""
     user = db.query(models.User).filter(models.User.username == username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    following = []
-    for followed_user in user.following:
-        following.append(
-            schemas.UserListItem(
-                id=followed_user.id,
-                username=followed_user.username,
-                display_name=followed_user.display_name,
-                bio=followed_user.bio,
-                profile_picture=followed_user.profile_picture,
-                is_following=followed_user in current_user.following,
-                is_blocked=followed_user in current_user.blocking
-                or current_user in followed_user.blocking,
-            )
-        )
-
-    return following
+    followers = models.followers
+    page = _relationship_list(
+        db,
+        response,
+        current_user.id,
+        user.id,
+        followers.c.followed_id,
+        followers.c.follower_id,
+        limit,
+        cursor,
+    )
+    return model_response(page, response)
 
 
 @router.get("/{username}", response_model=schemas.UserProfileResponse)
 def get_user_profile(
     username: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    """Get user profile by username"""
+    """Get user profile by username (304 if ``If-None-Match`` is current)"""
     user = db.query(models.User).filter(models.User.username == username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
+    not_modified = check_not_modified(
+        response, profile_etag(db, user.id, current_user.id), if_none_match
+    )
+    if not_modified:
+        return not_modified
+
     # Check if blocked
-    is_blocked = user in current_user.blocking or current_user in user.blocking
+    is_blocked = user.id in blocked_user_ids(db, current_user.id)
 
-    followers_count = len(user.followers)
-    following_count = len(user.following)
-    posts_count = db.query(models.Post).filter(models.Post.author_id == user.id).count()
-    is_following = user in current_user.following
+    followers = models.followers
+    is_following = db.query(
+        exists().where(
+            followers.c.follower_id == current_user.id,
+            followers.c.followed_id == user.id,
+        )
+    ).scalar()
 
     return schemas.UserProfileResponse(
         id=user.id,
@@ -101,16 +188,39 @@ def get_user_profile(
         bio=user.bio,
         profile_picture=user.profile_picture,
         created_at=user.created_at,
-        followers_count=followers_count,
-        following_count=following_count,
-        posts_count=posts_count,
+        followers_count=user.followers_count,
+        following_count=user.following_count,
+        posts_count=user.posts_count,
         is_following=is_following,
         is_blocked=is_blocked,
     )
 
 
+def _replace_avatar(db: Session, user: models.User, file_url: str) -> None:
+    """Point ``user``'s profile picture at ``file_url`` and release the old one"""
+    # Moves the blob reference
+    old_picture = user.profile_picture
+    user.profile_picture = file_url
+    db.flush()
+    media.require_blobs(db, [file_url])
+    db.commit()
+    invalidate_cached_user(user.email)
+
+    if old_picture and old_picture != file_url:
+        if old_picture.startswith("/static/uploads/avatars/"):
+            # Avatars uploaded before content-addressed storage
+            old_path = LEGACY_AVATAR_DIR / Path(old_picture).name
+            doomed = [old_path] + delete_derivatives(db, old_picture, LEGACY_AVATAR_DIR)
+            db.commit()
+            for path in doomed:
+                path.unlink(missing_ok=True)
+        else:
+            media.collect_garbage(db, [old_picture])
+
+
 @router.post("/me/upload-avatar")
 async def upload_avatar(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -126,36 +236,22 @@ async def upload_avatar(
             detail=f"File type not allowed. Allowed types: {', '.join(allowed_extensions)}",
         )
 
-    # Generate unique filename
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = UPLOAD_DIR / unique_filename
-
-    # Save file
+    # Save file (streamed in chunks; content must match the extension).
+    # Identical content is stored once and shared.
     try:
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
+        file_url, stored = await media.store_upload(db, file, file_ext)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
 
-    # Update user's profile picture
-    old_picture = current_user.profile_picture
-    current_user.profile_picture = f"/static/uploads/avatars/{unique_filename}"
-    db.commit()
+    await run_in_threadpool(_replace_avatar, db, current_user, file_url)
 
-    # Delete old uploaded avatar if it exists (but not default avatars)
-    if old_picture and old_picture.startswith("/static/uploads/avatars/"):
-        old_path = (
-            Path(__file__).parent.parent
-            / "static"
-            / "uploads"
-            / "avatars"
-            / Path(old_picture).name
+    if stored.created:
+        background_tasks.add_task(
+            media.process_image, file_url, stored.path, db.get_bind()
         )
-        if old_path.exists():
-            old_path.unlink()
-
-    return {"url": current_user.profile_picture, "filename": file.filename}
+    return {"url": file_url, "filename": file.filename}
 
 
 @router.put("/me", response_model=schemas.UserResponse)
@@ -165,6 +261,7 @@ def update_current_user(
     db: Session = Depends(get_db),
 ):
     """Update current user's profile"""
+    old_picture = current_user.profile_picture
     if user_update.display_name is not None:
         current_user.display_name = user_update.display_name
     if user_update.bio is not None:
@@ -180,8 +277,14 @@ def update_current_user(
     if user_update.text_density is not None:
         current_user.text_density = user_update.text_density
 
+    db.flush()
+    if current_user.profile_picture != old_picture:
+        media.require_blobs(db, [current_user.profile_picture])
     db.commit()
+    if current_user.profile_picture != old_picture:
+        media.collect_garbage(db, [old_picture])
     db.refresh(current_user)
+    invalidate_cached_user(current_user.email)
 
     return schemas.UserResponse(
         id=current_user.id,
@@ -193,8 +296,8 @@ def update_current_user(
         theme=current_user.theme,
         text_density=current_user.text_density,
         created_at=current_user.created_at,
-        followers_count=len(current_user.followers),
-        following_count=len(current_user.following),
+        followers_count=current_user.followers_count,
+        following_count=current_user.following_count,
         is_following=False,
         is_blocked=False,
     )
@@ -205,8 +308,14 @@ def delete_current_user(
     current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)
 ):
     """Delete current user's account"""
+    email = current_user.email
+    released = [current_user.profile_picture] + [
+        url for post in current_user.posts for url in (post.image_url, post.video_url)
+    ]
     db.delete(current_user)
     db.commit()
+    invalidate_cached_user(email)
+    media.collect_garbage(db, released)
     return {"message": "Account deleted successfully"}
 
 
@@ -226,11 +335,10 @@ def follow_user(
     if user_to_follow.id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot follow yourself")
 
-    if user_to_follow in current_user.following:
+    if not relationships.follow(db, current_user.id, user_to_follow.id):
         raise HTTPException(status_code=400, detail="Already following this user")
-
-    current_user.following.append(user_to_follow)
     db.commit()
+    events.publish("relationship", user_to_follow.id, current_user.id)
 
     return {"message": f"Now following {username}"}
 
@@ -248,11 +356,10 @@ def unfollow_user(
     if not user_to_unfollow:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if user_to_unfollow not in current_user.following:
+    if not relationships.unfollow(db, current_user.id, user_to_unfollow.id):
         raise HTTPException(status_code=400, detail="Not following this user")
-
-    current_user.following.remove(user_to_unfollow)
     db.commit()
+    events.publish("relationship", user_to_unfollow.id, current_user.id)
 
     return {"message": f"Unfollowed {username}"}
 
@@ -273,17 +380,11 @@ def block_user(
     if user_to_block.id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot block yourself")
 
-    if user_to_block in current_user.blocking:
+    # Also removes follows in either direction
+    if not relationships.block(db, current_user.id, user_to_block.id):
         raise HTTPException(status_code=400, detail="Already blocking this user")
-
-    # Unfollow if following
-    if user_to_block in current_user.following:
-        current_user.following.remove(user_to_block)
-    if current_user in user_to_block.following:
-        user_to_block.following.remove(current_user)
-
-    current_user.blocking.append(user_to_block)
     db.commit()
+    events.publish("relationship", user_to_block.id, current_user.id)
 
     return {"message": f"Blocked {username}"}
 
@@ -301,11 +402,10 @@ def unblock_user(
     if not user_to_unblock:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if user_to_unblock not in current_user.blocking:
+    if not relationships.unblock(db, current_user.id, user_to_unblock.id):
         raise HTTPException(status_code=400, detail="Not blocking this user")
-
-    current_user.blocking.remove(user_to_unblock)
     db.commit()
+    events.publish("relationship", user_to_unblock.id, current_user.id)
 
     return {"message": f"Unblocked {username}"}
 
@@ -313,104 +413,25 @@ def unblock_user(
 @router.get("/{username}/posts", response_model=List[schemas.PostResponse])
 def get_user_posts(
     username: str,
+    response: Response,
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    """Get posts by a specific user"""
+    """Get posts by a specific user (supports ``cursor`` keyset pagination)"""
     user = db.query(models.User).filter(models.User.username == username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     # Check if blocked
-    if user in current_user.blocking or current_user in user.blocking:
-        return []
-
-    posts = (
-        db.query(models.Post)
-        .filter(models.Post.author_id == user.id)
-        .order_by(models.Post.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
-
-    result = []
-    for post in posts:
-        # Get counts
-        comments_count = len(post.comments)
-        reactions_count = len(post.reactions)
-        reposts_count = (
-            db.query(models.Post)
-            .filter(models.Post.original_post_id == post.id)
-            .count()
-        )
+    if user.id in blocked_user_ids(db, current_user.id):
+        return model_response([])
 
-        # Check user reaction
-        user_reaction = None
-        for reaction in post.reactions:
-            if reaction.user_id == current_user.id:
-                user_reaction = reaction.reaction_type
-                break
-
-        # Check if user has reposted
-        has_reposted = (
-            db.query(models.Post)
-            .filter(
-                models.Post.author_id == current_user.id,
-                models.Post.original_post_id == post.id,
-            )
-            .first()
-            is not None
-        )
-
-        # Handle original post for reposts
-        original_post = None
-        if post.is_repost and post.original_post:
-            orig = post.original_post
-            original_post = schemas.PostResponse(
-                id=orig.id,
-                content=orig.content,
-                image_url=orig.image_url,
-                video_url=orig.video_url,
-                is_repost=False,
-                original_post_id=None,
-                original_post=None,
-                author_id=orig.author_id,
-                author_username=orig.author.username,
-                author_display_name=orig.author.display_name,
-                author_profile_picture=orig.author.profile_picture,
-                created_at=orig.created_at,
-                comments_count=len(orig.comments),
-                reactions_count=len(orig.reactions),
-                reposts_count=db.query(models.Post)
-                .filter(models.Post.original_post_id == orig.id)
-                .count(),
-                user_reaction=None,
-                has_reposted=False,
-            )
-
-        result.append(
-            schemas.PostResponse(
-                id=post.id,
-                content=post.content,
-                image_url=post.image_url,
-                video_url=post.video_url,
-                is_repost=post.is_repost,
-                original_post_id=post.original_post_id,
-                original_post=original_post,
-                author_id=post.author_id,
-                author_username=post.author.username,
-                author_display_name=post.author.display_name,
-                author_profile_picture=post.author.profile_picture,
-                created_at=post.created_at,
-                comments_count=comments_count,
-                reactions_count=reactions_count,
-                reposts_count=reposts_count,
-                user_reaction=user_reaction,
-                has_reposted=has_reposted,
-            )
-        )
+    query = db.query(models.Post.id, models.Post.created_at).filter(
+        models.Post.author_id == user.id
+    )
+    post_ids = paginate_post_ids(query, response, skip, limit, cursor)
 
-    return result
+    return model_response(hydrate_posts(db, post_ids, current_user), response)
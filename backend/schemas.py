@@ -145,6 +145,8 @@ class PostResponse(BaseModel):
     id: int
     content: str
     image_url: Optional[str] = None
+    # Resized WebP renditions of image_url ("<url> <width>w, ...")
+    image_srcset: Optional[str] = None
     video_url: Optional[str] = None
     is_repost: bool = False
     original_post_id: Optional[int] = None
@@ -0,0 +1,283 @@
+"""
+Static media serving for the ``/static`` mount.
+
+``MediaStaticFiles`` extends Starlette's ``StaticFiles`` with:
+
+* byte ranges (``206 Partial Content``), so video seeks fetch only the
+  requested part instead of re-downloading the whole file;
+* strong ETags: the content digest for content-addressed uploads, the file's
+  size and modification time otherwise;
+* ``Cache-Control: immutable`` for content-addressed uploads, whose URL
+  changes whenever the content does;
+* zero-copy sends when the server supports the ASGI ``zerocopysend`` or
+  ``pathsend`` extensions, falling back to chunked reads.
+
+``FrontendStaticFiles`` serves the built frontend: it picks a precompressed
+``.br``/``.gz`` sibling (written by ``precompress.py``) matching the
+request's ``Accept-Encoding``, marks hashed asset filenames immutable and
+makes HTML revalidate on every load.
+"""
+
+import os
+import re
+from functools import lru_cache
+from mimetypes import guess_type
+from typing import Optional, Set, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+from uploads import DIGEST_SIZE
+
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE_SECONDS", "3600"))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Content-addressed uploads: uploads/ab/cd/<digest>[.<width>w].<ext>
+_CONTENT_ADDRESSED = re.compile(
+    r"(?:^|/)uploads/([0-9a-f]{2})/([0-9a-f]{2})/"
+    rf"(\1\2[0-9a-f]{{{DIGEST_SIZE * 2 - 4}}})(\.\d+w)?\.\w+$"
+)
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single ``bytes=`` range into an inclusive ``(start, end)``.
+
+    Returns ``None`` for anything other than one range (the caller then
+    serves the whole file, which RFC 9110 allows) and raises ``ValueError``
+    if the range cannot be satisfied.
+    """
+    match = _RANGE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+class MediaFileResponse(FileResponse):
+    """``FileResponse`` with range support, strong ETags and zero-copy sends"""
+
+    def __init__(
+        self, path, stat_result: os.stat_result, media_type: Optional[str] = None
+    ):
+        self.content_digest = None
+        match = _CONTENT_ADDRESSED.search(os.fspath(path).replace(os.sep, "/"))
+        if match:
+            self.content_digest = match.group(3) + (match.group(4) or "")
+        super().__init__(path, stat_result=stat_result, media_type=media_type)
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["cache-control"] = (
+            IMMUTABLE_CACHE_CONTROL
+            if self.content_digest
+            else f"public, max-age={STATIC_MAX_AGE}"
+        )
+        self.range: Optional[Tuple[int, int]] = None
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        super().set_stat_headers(stat_result)
+        if self.content_digest:
+            self.headers["etag"] = f'"{self.content_digest}"'
+        else:
+            self.headers["etag"] = (
+                f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+            )
+
+    def select_range(self, request_headers: Headers) -> Optional[Response]:
+        """Apply the request's Range header; returns a 416 response if unsatisfiable"""
+        range_header = request_headers.get("range")
+        if not range_header:
+            return None
+        if_range = request_headers.get("if-range")
+        if if_range and if_range.strip() != self.headers["etag"]:
+            # The client's partial copy is stale: send the whole file
+            return None
+
+        size = self.stat_result.st_size
+        try:
+            selected = parse_range(range_header, size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={"content-range": f"bytes */{size}", "accept-ranges": "bytes"},
+            )
+        if selected is not None:
+            start, end = selected
+            self.range = selected
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+            self.headers["content-length"] = str(end - start + 1)
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        start, end = self.range or (0, self.stat_result.st_size - 1)
+        count = end - start + 1
+        extensions = scope.get("extensions") or {}
+
+        if "http.response.zerocopysend" in extensions:
+            with open(self.path, "rb") as file:
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": file,
+                        "offset": start,
+                        "count": count,
+                        "more_body": False,
+                    }
+                )
+        elif "http.response.pathsend" in extensions and self.range is None:
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(start)
+                remaining = count
+                while True:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    remaining -= len(chunk)
+                    more_body = bool(chunk) and remaining > 0
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": chunk,
+                            "more_body": more_body,
+                        }
+                    )
+                    if not more_body:
+                        break
+
+
+class MediaStaticFiles(StaticFiles):
+    """``StaticFiles`` serving ``MediaFileResponse``s"""
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        response = MediaFileResponse(full_path, stat_result)
+        if status_code != 200:
+            # html=True 404 pages: plain response, no ranges or revalidation
+            response.status_code = status_code
+            return response
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        unsatisfiable = response.select_range(request_headers)
+        return unsatisfiable or response
+
+
+# Preference order when several encodings are acceptable
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+# Vite's default output: assets/<name>-<content hash>.<ext>
+_HASHED_ASSET = re.compile(r"(?:^|/)assets/[^/]+-[A-Za-z0-9_-]{8,}\.\w+$")
+
+
+def accepted_encodings(header: Optional[str]) -> Set[str]:
+    """Content codings allowed by an ``Accept-Encoding`` header (q > 0)"""
+    qualities = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    wildcard = qualities.pop("*", 0)
+    accepted = {coding for coding, quality in qualities.items() if quality > 0}
+    if wildcard > 0:
+        # "*" covers every coding not listed explicitly
+        accepted.update(
+            coding for coding, _ in PRECOMPRESSED_ENCODINGS if coding not in qualities
+        )
+    return accepted
+
+
+@lru_cache(maxsize=4096)
+def _precompressed_siblings(path: str, mtime_ns: int) -> Tuple[Tuple[str, str], ...]:
+    # Keyed by mtime so a rebuilt asset is looked up again
+    return tuple(
+        (coding, path + suffix)
+        for coding, suffix in PRECOMPRESSED_ENCODINGS
+        if os.path.isfile(path + suffix)
+    )
+
+
+class FrontendStaticFiles(MediaStaticFiles):
+    """Serves the frontend build with precompressed assets and cache headers"""
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        path = os.fspath(full_path)
+        media_type = guess_type(path)[0] or "text/plain"
+
+        encoding = None
+        siblings = _precompressed_siblings(path, stat_result.st_mtime_ns)
+        if siblings:
+            accepted = accepted_encodings(request_headers.get("accept-encoding"))
+            for coding, sibling in siblings:
+                if coding in accepted:
+                    encoding, path = coding, sibling
+                    stat_result = os.stat(sibling)
+                    break
+
+        response = MediaFileResponse(path, stat_result, media_type=media_type)
+        if siblings:
+            response.headers["vary"] = "Accept-Encoding"
+        if encoding:
+            response.headers["content-encoding"] = encoding
+        if path.endswith((".html", ".html.br", ".html.gz")):
+            response.headers["cache-control"] = "no-cache"
+        elif _HASHED_ASSET.search(os.fspath(full_path).replace(os.sep, "/")):
+            response.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+
+        if status_code != 200:
+            response.status_code = status_code
+            return response
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        if encoding:
+            # Ranges of an encoded representation are not worth supporting
+            return response
+        unsatisfiable = response.select_range(request_headers)
+        return unsatisfiable or response
@@ -17,7 +17,8 @@ from sqlalchemy.orm import Session, sessionmaker
 # Add parent directory to path so we can import from backend
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from auth import create_access_token, get_password_hash
+from auth import create_access_token, get_password_hash, user_cache
+from blocking import blocked_ids_cache
 from database import Base, get_db
 from main import app
 from models import Comment, Post, Reaction, User
@@ -165,6 +166,9 @@ def db_session() -> Generator[Session, None, None]:
         # Cleanup: Close session and drop all tables after test
         session.close()
         Base.metadata.drop_all(bind=test_engine)
+        # Cached users would otherwise outlive the tables they came from
+        user_cache.clear()
+        blocked_ids_cache.clear()
 
 
 @pytest.fixture(scope="function")
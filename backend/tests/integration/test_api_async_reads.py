@@ -0,0 +1,100 @@
+"""
+Integration tests for the async read endpoints (ASYNC_DATABASE=true).
+
+The async routes must return exactly what the sync routes return for the
+same data, so each test compares the two.
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from database import async_database_url, get_async_db
+from routers import async_reads
+from tests.conftest import TEST_DATABASE_URL
+
+
+@pytest.fixture
+def async_client(db_session):
+    """Client for an app serving only the async routes, on the test database"""
+    engine = create_async_engine(
+        async_database_url(TEST_DATABASE_URL), poolclass=NullPool
+    )
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with session_factory() as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(async_reads.router, prefix="/api")
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.mark.integration
+@pytest.mark.api
+class TestAsyncReads:
+    """Async feed, profile and post detail handlers."""
+
+    def test_all_feed_matches_sync(
+        self, client, async_client, test_posts, auth_headers
+    ):
+        """Test that the async all feed matches the sync one, cursor included."""
+        sync_response = client.get("/api/feed/all?limit=2", headers=auth_headers)
+        async_response = async_client.get("/api/feed/all?limit=2", headers=auth_headers)
+
+        assert async_response.status_code == 200
+        assert async_response.json() == sync_response.json()
+        assert (
+            async_response.headers["X-Next-Cursor"]
+            == sync_response.headers["X-Next-Cursor"]
+        )
+
+    def test_following_feed_matches_sync(
+        self, client, async_client, test_user, test_user_2, db_session, auth_headers
+    ):
+        """Test that the async following feed matches the sync one."""
+        test_user.following.append(test_user_2)
+        db_session.commit()
+        client.post(
+            "/api/posts/", json={"content": "Followed post"}, headers=auth_headers
+        )
+
+        sync_response = client.get("/api/feed/following", headers=auth_headers)
+        async_response = async_client.get("/api/feed/following", headers=auth_headers)
+
+        assert async_response.status_code == 200
+        assert async_response.json() == sync_response.json()
+
+    def test_profile_matches_sync(
+        self, client, async_client, test_user_2, auth_headers
+    ):
+        """Test that the async profile matches the sync one."""
+        path = f"/api/users/{test_user_2.username}"
+
+        async_response = async_client.get(path, headers=auth_headers)
+
+        assert async_response.status_code == 200
+        assert async_response.json() == client.get(path, headers=auth_headers).json()
+
+    def test_post_detail_is_public(self, client, async_client, test_post):
+        """Test that the async post detail is served without auth."""
+        path = f"/api/posts/{test_post.id}"
+
+        async_response = async_client.get(path)
+
+        assert async_response.status_code == 200
+        assert async_response.json() == client.get(path).json()
+
+    def test_errors_match_sync(self, async_client, auth_headers):
+        """Test that the async handlers return the same error codes."""
+        assert async_client.get("/api/feed/all").status_code in [401, 403]
+        assert (
+            async_client.get("/api/users/nobody", headers=auth_headers).status_code
+            == 404
+        )
+        assert async_client.get("/api/posts/999999").status_code == 404
@@ -243,6 +243,25 @@ class TestLoginEndpoint:
         # In production, you might want case-insensitive email matching
         assert response.status_code in [200, 401]
 
+    def test_login_sheds_load_when_hash_pool_is_full(
+        self, client, test_user, monkeypatch
+    ):
+        """Test that login returns 503 instead of queueing unbounded bcrypt work."""
+        from auth import password_pool
+
+        monkeypatch.setattr(password_pool, "max_pending", 0)
+
+        response = client.post(
+            "/api/auth/login",
+            json={
+                "email": "testuser@example.com",
+                "password": "TestPassword123!",
+            },
+        )
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+
 
 @pytest.mark.integration
 @pytest.mark.api
@@ -4,8 +4,16 @@ Integration tests for feed API endpoints.
 These tests verify feed generation, filtering, and ordering.
 """
 
+import asyncio
+import json
+
 import pytest
 
+import events
+from auth import create_access_token
+from blocking import blocked_ids_cache
+from tests.conftest import create_authenticated_headers, login_user
+
 
 @pytest.mark.integration
 @pytest.mark.api
@@ -93,6 +101,81 @@ class TestGetFollowingFeed:
         for post in data:
             assert post["author_username"] in [test_user.username, test_user_2.username]
 
+    def test_following_feed_tracks_follow_post_and_unfollow(
+        self, client, test_user, test_user_2, test_posts, auth_headers
+    ):
+        """Test that the home timeline is backfilled, fanned out and pruned."""
+        user_2_posts = {p.id for p in test_posts if p.author_id == test_user_2.id}
+        client.post(f"/api/users/{test_user_2.username}/follow", headers=auth_headers)
+
+        data = client.get("/api/feed/following", headers=auth_headers).json()
+        assert {post["id"] for post in data} == user_2_posts
+
+        token_2 = login_user(client, test_user_2.email, "TestPassword456!")
+        new_post = client.post(
+            "/api/posts/",
+            json={"content": "Fresh post"},
+            headers=create_authenticated_headers(token_2["access_token"]),
+        ).json()
+
+        data = client.get("/api/feed/following", headers=auth_headers).json()
+        assert data[0]["id"] == new_post["id"]
+
+        client.delete(f"/api/users/{test_user_2.username}/follow", headers=auth_headers)
+
+        data = client.get("/api/feed/following", headers=auth_headers).json()
+        assert data == []
+
+    def test_following_feed_reads_celebrity_posts_directly(
+        self,
+        client,
+        test_user,
+        test_user_2,
+        test_posts,
+        auth_headers,
+        db_session,
+        monkeypatch,
+    ):
+        """Test that accounts above the follower threshold use fan-out-on-read."""
+        import models
+
+        monkeypatch.setattr(models, "TIMELINE_CELEBRITY_THRESHOLD", 0)
+        client.post(f"/api/users/{test_user_2.username}/follow", headers=auth_headers)
+
+        assert db_session.query(models.TimelineEntry).count() == 0
+
+        data = client.get("/api/feed/following", headers=auth_headers).json()
+        user_2_posts = {p.id for p in test_posts if p.author_id == test_user_2.id}
+        assert {post["id"] for post in data} == user_2_posts
+
+    def test_posts_stay_after_dropping_below_threshold(
+        self,
+        client,
+        test_user,
+        test_user_2,
+        test_user_3,
+        auth_headers,
+        db_session,
+        monkeypatch,
+    ):
+        """Test that posts skipped on write remain once an account shrinks."""
+        import models
+
+        monkeypatch.setattr(models, "TIMELINE_CELEBRITY_THRESHOLD", 1)
+        test_user.following.append(test_user_2)
+        test_user_3.following.append(test_user_2)
+        db_session.commit()
+        post = models.Post(author_id=test_user_2.id, content="Big announcement")
+        db_session.add(post)
+        db_session.commit()
+        assert db_session.query(models.TimelineEntry).count() == 0
+
+        test_user_3.following.remove(test_user_2)
+        db_session.commit()
+
+        data = client.get("/api/feed/following", headers=auth_headers).json()
+        assert [item["id"] for item in data] == [post.id]
+
     def test_following_feed_without_auth(self, client):
         """Test that following feed requires authentication."""
         response = client.get("/api/feed/following")
@@ -125,6 +208,29 @@ class TestFeedFiltering:
         ]
         assert len(blocked_posts) == 0
 
+    def test_following_feed_page_is_full_despite_blocked_entries(
+        self, client, test_user, test_user_2, test_user_3, auth_headers, db_session
+    ):
+        """Test that blocked authors are excluded before LIMIT, not after."""
+        from models import Post, blocks
+
+        test_user.following.extend([test_user_2, test_user_3])
+        db_session.commit()
+        for user in (test_user_3, test_user_2, test_user_2):
+            db_session.add(Post(author_id=user.id, content=f"By {user.username}"))
+            db_session.commit()
+        # A block recorded without the follow edge being removed
+        db_session.execute(
+            blocks.insert().values(blocker_id=test_user_2.id, blocked_id=test_user.id)
+        )
+        db_session.commit()
+
+        response = client.get("/api/feed/following?limit=1", headers=auth_headers)
+
+        assert [post["author_username"] for post in response.json()] == [
+            test_user_3.username
+        ]
+
     def test_following_feed_includes_own_posts(
         self, client, test_user, test_post, auth_headers
     ):
@@ -213,6 +319,54 @@ class TestFeedPagination:
         # Should return a reasonable number (e.g., max 50)
         assert len(data) <= 100
 
+    def test_cursor_pagination_walks_every_post_once(
+        self, client, test_user, auth_headers, db_session
+    ):
+        """Test that following X-Next-Cursor visits each post exactly once."""
+        from datetime import datetime
+
+        from models import Post
+
+        # Identical timestamps force the id tie-breaker to be used
+        created_at = datetime(2024, 1, 1, 12, 0, 0)
+        for i in range(7):
+            db_session.add(
+                Post(author_id=test_user.id, content=f"Post {i}", created_at=created_at)
+            )
+        db_session.commit()
+
+        seen = []
+        cursor = None
+        for _ in range(10):
+            params = {"limit": 3}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.get("/api/feed/all", params=params, headers=auth_headers)
+            assert response.status_code == 200
+            seen.extend(post["id"] for post in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+
+        assert len(seen) == 7
+        assert len(set(seen)) == 7
+        assert seen == sorted(seen, reverse=True)
+
+    def test_offset_pagination_still_supported(self, client, test_posts, auth_headers):
+        """Test that skip/limit keeps working alongside cursors."""
+        first = client.get("/api/feed/all?limit=2", headers=auth_headers).json()
+        second = client.get("/api/feed/all?skip=2&limit=2", headers=auth_headers).json()
+
+        assert len(first) == 2
+        assert len(second) == 2
+        assert not {p["id"] for p in first} & {p["id"] for p in second}
+
+    def test_invalid_cursor_returns_400(self, client, auth_headers):
+        """Test that a malformed cursor is rejected."""
+        response = client.get("/api/feed/all?cursor=not-a-cursor", headers=auth_headers)
+
+        assert response.status_code == 400
+
 
 @pytest.mark.integration
 @pytest.mark.api
@@ -238,3 +392,242 @@ class TestFeedPerformance:
         assert response.status_code == 200
         data = response.json()
         assert len(data) >= 50
+
+    def test_feed_query_count_does_not_grow_with_page_size(
+        self, client, test_user, test_user_2, auth_headers, db_session
+    ):
+        """Test that feed hydration uses a fixed number of queries per page."""
+        from sqlalchemy import event
+
+        from models import Comment, Post, Reaction
+        from tests.conftest import test_engine
+
+        def count_feed_queries():
+            # Measure both pages from the same (cold) block cache
+            blocked_ids_cache.clear()
+            statements = []
+
+            def before_execute(conn, cursor, statement, *args):
+                statements.append(statement)
+
+            event.listen(test_engine, "before_cursor_execute", before_execute)
+            try:
+                response = client.get("/api/feed/all", headers=auth_headers)
+            finally:
+                event.remove(test_engine, "before_cursor_execute", before_execute)
+            assert response.status_code == 200
+            return len(response.json()), len(statements)
+
+        def add_posts(count):
+            for i in range(count):
+                post = Post(author_id=test_user_2.id, content=f"Post {i}")
+                db_session.add(post)
+                db_session.flush()
+                db_session.add(
+                    Comment(post_id=post.id, author_id=test_user.id, content="Hi")
+                )
+                db_session.add(
+                    Reaction(
+                        post_id=post.id, user_id=test_user.id, reaction_type="like"
+                    )
+                )
+                db_session.add(
+                    Post(
+                        author_id=test_user.id,
+                        content="",
+                        is_repost=True,
+                        original_post_id=post.id,
+                    )
+                )
+            db_session.commit()
+
+        add_posts(2)
+        small_page, small_queries = count_feed_queries()
+
+        add_posts(20)
+        large_page, large_queries = count_feed_queries()
+
+        assert large_page > small_page
+        assert large_queries == small_queries
+
+
+@pytest.mark.integration
+@pytest.mark.api
+class TestFeedConditionalGet:
+    """Test ETag / If-None-Match on feeds."""
+
+    def _get(self, client, headers, etag=None):
+        if etag:
+            headers = {**headers, "If-None-Match": etag}
+        return client.get("/api/feed/all?limit=3", headers=headers)
+
+    def test_unchanged_feed_returns_304_without_hydrating(
+        self, client, test_posts, auth_headers, monkeypatch
+    ):
+        """Test that a matching ETag short-circuits before hydration."""
+        first = self._get(client, auth_headers)
+        etag = first.headers["ETag"]
+        assert etag.startswith('W/"')
+        assert first.headers["Cache-Control"] == "private, no-cache"
+
+        def fail(*args, **kwargs):
+            raise AssertionError("hydrate_posts called for a 304")
+
+        monkeypatch.setattr("routers.feed.hydrate_posts", fail)
+        response = self._get(client, auth_headers, etag)
+
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+        assert response.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+
+    def test_reaction_changes_etag(self, client, test_posts, test_user_2, auth_headers):
+        """Test that another user's reaction on a shown post invalidates it."""
+        etag = self._get(client, auth_headers).headers["ETag"]
+        shown = self._get(client, auth_headers).json()[0]["id"]
+        token = create_access_token(data={"sub": test_user_2.email})
+        client.post(
+            f"/api/posts/{shown}/reactions",
+            json={"reaction_type": "love"},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+
+        response = self._get(client, auth_headers, etag)
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    def test_new_post_changes_etag(self, client, test_posts, auth_headers):
+        """Test that a new post invalidates the feed ETag."""
+        etag = self._get(client, auth_headers).headers["ETag"]
+        client.post("/api/posts/", json={"content": "Fresh"}, headers=auth_headers)
+
+        response = self._get(client, auth_headers, etag)
+
+        assert response.status_code == 200
+        assert response.json()[0]["content"] == "Fresh"
+
+    def test_profile_edit_of_author_changes_etag(
+        self, client, test_posts, auth_headers
+    ):
+        """Test that editing an author's profile invalidates the feed ETag."""
+        etag = self._get(client, auth_headers).headers["ETag"]
+        client.put(
+            "/api/users/me", json={"display_name": "Renamed"}, headers=auth_headers
+        )
+
+        assert self._get(client, auth_headers, etag).status_code == 200
+
+
+@pytest.mark.integration
+@pytest.mark.api
+class TestFeedStream:
+    """Test the /api/feed/stream Server-Sent Events endpoint."""
+
+    async def _open(self, client, headers):
+        """Start the stream at the ASGI level (TestClient buffers bodies)."""
+        chunks = asyncio.Queue()
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                await chunks.put(message["body"].decode())
+
+        scope = {
+            "type": "http",
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/api/feed/stream",
+            "raw_path": b"/api/feed/stream",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [
+                (name.lower().encode(), value.encode())
+                for name, value in headers.items()
+            ],
+            "client": ("testclient", 50000),
+            "server": ("testserver", 80),
+        }
+        task = asyncio.create_task(client.app(scope, receive, send))
+        assert (await asyncio.wait_for(chunks.get(), 5)).startswith("retry:")
+        return chunks, disconnected, task
+
+    async def _close(self, disconnected, task):
+        disconnected.set()
+        await asyncio.wait_for(task, 5)
+
+    async def test_only_followed_authors_are_streamed(
+        self, client, db_session, test_user, test_user_2, test_user_3, auth_headers
+    ):
+        """Test that events about unfollowed authors are filtered out."""
+        test_user.following.append(test_user_2)
+        db_session.commit()
+        chunks, disconnected, task = await self._open(client, auth_headers)
+
+        events.publish("post", test_user_3.id, test_user_3.id, post_id=1)
+        events.publish("post", test_user_2.id, test_user_2.id, post_id=2)
+        message = await asyncio.wait_for(chunks.get(), 5)
+        await self._close(disconnected, task)
+
+        assert message.startswith("event: post\n")
+        assert json.loads(message.split("data: ", 1)[1])["post_id"] == 2
+
+    async def test_new_post_and_reaction_are_published(
+        self, client, db_session, test_user, test_user_2, auth_headers
+    ):
+        """Test that creating a post and reacting to it reach followers."""
+        test_user.following.append(test_user_2)
+        db_session.commit()
+        author_headers = create_authenticated_headers(
+            create_access_token(data={"sub": test_user_2.email})
+        )
+        chunks, disconnected, task = await self._open(client, auth_headers)
+
+        post_id = client.post(
+            "/api/posts/", json={"content": "Live"}, headers=author_headers
+        ).json()["id"]
+        client.post(
+            f"/api/posts/{post_id}/reactions",
+            json={"reaction_type": "like"},
+            headers=auth_headers,
+        )
+        created = await asyncio.wait_for(chunks.get(), 5)
+        reacted = await asyncio.wait_for(chunks.get(), 5)
+        await self._close(disconnected, task)
+
+        assert created.startswith("event: post\n")
+        assert reacted.startswith("event: reaction\n")
+        assert json.loads(reacted.split("data: ", 1)[1])["reactions_count"] == 1
+
+    async def test_blocking_stops_events(
+        self, client, db_session, test_user, test_user_2, auth_headers
+    ):
+        """Test that blocking an author stops their events immediately."""
+        test_user.following.append(test_user_2)
+        db_session.commit()
+        chunks, disconnected, task = await self._open(client, auth_headers)
+
+        client.post(f"/api/users/{test_user_2.username}/block", headers=auth_headers)
+        events.publish("post", test_user_2.id, test_user_2.id, post_id=1)
+        events.publish("post", test_user.id, test_user.id, post_id=2)
+        message = await asyncio.wait_for(chunks.get(), 5)
+        await self._close(disconnected, task)
+
+        assert json.loads(message.split("data: ", 1)[1])["post_id"] == 2
+
+    async def test_slow_subscriber_gets_resync(self):
+        """Test that a full subscriber queue is replaced by a resync marker."""
+        bus = events.InProcessEventBus(queue_size=2)
+        queue = bus.subscribe()
+
+        for post_id in range(3):
+            bus.publish(events.FeedEvent("post", 1, 1, {"post_id": post_id}))
+        await asyncio.sleep(0)
+
+        assert queue.get_nowait() is events.RESYNC
+        assert queue.empty()
@@ -0,0 +1,406 @@
+"""
+Integration tests for uploads and request body limits.
+"""
+
+import pytest
+
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+MB = 1024 * 1024
+
+
+@pytest.mark.integration
+@pytest.mark.api
+class TestRequestSizeLimit:
+    """Test the streaming request body limit."""
+
+    def test_content_length_over_limit_rejected(self, client, auth_headers):
+        """Test that a declared oversized body is refused with 413."""
+        response = client.post(
+            "/api/posts/upload",
+            content=b"x" * (MAX_UPLOAD_SIZE + 1),
+            headers={**auth_headers, "Content-Type": "application/octet-stream"},
+        )
+
+        assert response.status_code == 413
+        assert response.json()["detail"] == "Request body too large"
+
+    def test_chunked_body_over_limit_rejected(self, client, auth_headers):
+        """Test that a chunked upload without Content-Length is rejected."""
+
+        def chunks():
+            for _ in range(11):
+                yield b"x" * MB
+
+        response = client.post(
+            "/api/posts/upload",
+            content=chunks(),
+            headers={
+                **auth_headers,
+                "Content-Type": "multipart/form-data; boundary=xyz",
+            },
+        )
+
+        assert response.status_code == 413
+
+    async def test_body_read_stops_at_limit(self):
+        """Test that the limiter aborts mid-stream instead of draining the body."""
+        from fastapi import FastAPI, Request
+
+        from middleware import RequestSizeLimitMiddleware
+
+        app = FastAPI()
+
+        @app.post("/echo")
+        async def echo(request: Request):
+            return {"size": len(await request.body())}
+
+        limited = RequestSizeLimitMiddleware(app, max_upload_size=3 * MB)
+        delivered = []
+        sent = []
+
+        async def receive():
+            delivered.append(MB)
+            return {"type": "http.request", "body": b"x" * MB, "more_body": True}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "path": "/echo",
+            "headers": [],
+            "query_string": b"",
+        }
+        await limited(scope, receive, send)
+
+        assert sent[0]["status"] == 413
+        assert sum(delivered) == 4 * MB
+
+    def test_body_within_limit_allowed(self, client, auth_headers):
+        """Test that normal requests pass through the limiter."""
+        response = client.post(
+            "/api/posts/", json={"content": "Small post"}, headers=auth_headers
+        )
+
+        assert response.status_code == 201
+
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+
+
+@pytest.fixture
+def media_dir(tmp_path, monkeypatch):
+    """Redirect the upload store to a temporary directory, with no GC grace"""
+    import media
+
+    directory = tmp_path / "uploads"
+    directory.mkdir()
+    monkeypatch.setattr(media, "UPLOAD_DIR", directory)
+    monkeypatch.setattr(media, "MEDIA_GC_GRACE_SECONDS", 0)
+    return directory
+
+
+def _stored_files(directory):
+    return sorted(path for path in directory.rglob("*") if path.is_file())
+
+
+def _upload(client, headers, name, content, path="/api/posts/upload"):
+    return client.post(
+        path, files={"file": (name, content, "image/png")}, headers=headers
+    )
+
+
+@pytest.mark.integration
+@pytest.mark.api
+class TestStreamingUploads:
+    """Test chunked media and avatar uploads."""
+
+    def test_upload_media_streams_to_disk(self, client, auth_headers, media_dir):
+        """Test that a multi-chunk upload is stored intact."""
+        from media import upload_path
+
+        content = PNG_HEADER + bytes(range(256)) * 2048  # several chunks
+
+        response = _upload(client, auth_headers, "photo.png", content)
+
+        assert response.status_code == 200
+        assert upload_path(response.json()["url"]).read_bytes() == content
+        assert not list(media_dir.rglob("*.part"))
+
+    def test_upload_rejects_mismatched_content(self, client, auth_headers, media_dir):
+        """Test that content not matching the extension is rejected."""
+        response = _upload(client, auth_headers, "photo.png", b"<?php echo 'hi'; ?>")
+
+        assert response.status_code == 400
+        assert _stored_files(media_dir) == []
+
+    def test_upload_avatar(self, client, auth_headers, media_dir):
+        """Test that an avatar upload is stored and set on the profile."""
+        from media import upload_path
+
+        content = b"GIF89a" + b"\x00" * 100
+
+        response = _upload(
+            client, auth_headers, "me.gif", content, "/api/users/me/upload-avatar"
+        )
+
+        assert response.status_code == 200
+        url = response.json()["url"]
+        assert upload_path(url).read_bytes() == content
+        assert (
+            client.get("/api/auth/me", headers=auth_headers).json()["profile_picture"]
+            == url
+        )
+
+
+@pytest.mark.integration
+@pytest.mark.api
+class TestContentAddressedStorage:
+    """Test deduplicated, reference-counted media blobs."""
+
+    def test_identical_uploads_share_one_blob(self, client, auth_headers, media_dir):
+        """Test that the same bytes are stored once under a sharded digest path."""
+        content = PNG_HEADER + b"same meme"
+
+        first = _upload(client, auth_headers, "a.png", content).json()["url"]
+        second = _upload(client, auth_headers, "b.png", content).json()["url"]
+
+        assert first == second
+        digest = first.rsplit("/", 1)[1].split(".")[0]
+        assert first == f"/static/uploads/{digest[:2]}/{digest[2:4]}/{digest}.png"
+        assert len(_stored_files(media_dir)) == 1
+
+    def test_blob_refcount_follows_posts(
+        self, client, auth_headers, db_session, media_dir
+    ):
+        """Test that posts using a blob hold references on it."""
+        from models import MediaBlob
+
+        url = _upload(client, auth_headers, "a.png", PNG_HEADER + b"x").json()["url"]
+        post_ids = [
+            client.post(
+                "/api/posts/",
+                json={"content": f"Post {i}", "image_url": url},
+                headers=auth_headers,
+            ).json()["id"]
+            for i in range(2)
+        ]
+
+        blob = db_session.query(MediaBlob).filter_by(url=url).one()
+        assert blob.refcount == 2
+
+        client.delete(f"/api/posts/{post_ids[0]}", headers=auth_headers)
+        db_session.refresh(blob)
+        assert blob.refcount == 1
+        assert len(_stored_files(media_dir)) == 1
+
+        client.delete(f"/api/posts/{post_ids[1]}", headers=auth_headers)
+        assert db_session.query(MediaBlob).count() == 0
+        assert _stored_files(media_dir) == []
+
+    def test_replaced_avatar_is_collected(
+        self, client, auth_headers, db_session, media_dir
+    ):
+        """Test that the previous avatar blob is removed once unreferenced."""
+        from media import upload_path
+
+        path = "/api/users/me/upload-avatar"
+        first = _upload(client, auth_headers, "a.png", PNG_HEADER + b"1", path).json()
+        second = _upload(client, auth_headers, "b.png", PNG_HEADER + b"2", path).json()
+
+        assert not upload_path(first["url"]).exists()
+        assert upload_path(second["url"]).exists()
+
+    def test_reupload_keeps_released_blob(
+        self, client, auth_headers, db_session, media_dir, monkeypatch
+    ):
+        """Test that a blob re-uploaded by someone else survives its release."""
+        from datetime import datetime, timedelta, timezone
+
+        import media
+        from models import MediaBlob
+
+        monkeypatch.setattr(media, "MEDIA_GC_GRACE_SECONDS", 3600)
+        content = PNG_HEADER + b"shared"
+        url = _upload(client, auth_headers, "a.png", content).json()["url"]
+        post_id = client.post(
+            "/api/posts/",
+            json={"content": "First", "image_url": url},
+            headers=auth_headers,
+        ).json()["id"]
+        db_session.query(MediaBlob).update(
+            {"uploaded_at": datetime.now(timezone.utc) - timedelta(hours=2)}
+        )
+        db_session.commit()
+
+        # A second uploader of the same bytes gets the same URL...
+        assert _upload(client, auth_headers, "b.png", content).json()["url"] == url
+        # ...and still holds it after the first post releases the blob
+        client.delete(f"/api/posts/{post_id}", headers=auth_headers)
+        assert media.upload_path(url).exists()
+
+        response = client.post(
+            "/api/posts/",
+            json={"content": "Second", "image_url": url},
+            headers=auth_headers,
+        )
+        assert response.status_code == 201
+
+    def test_post_with_collected_blob_rejected(
+        self, client, auth_headers, db_session, media_dir
+    ):
+        """Test that a post cannot reference an upload that was collected."""
+        import media
+
+        url = _upload(client, auth_headers, "a.png", PNG_HEADER + b"old").json()["url"]
+        assert media.collect_garbage(db_session) == 1
+
+        response = client.post(
+            "/api/posts/",
+            json={"content": "Late", "image_url": url},
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 400
+        assert client.get("/api/feed/all", headers=auth_headers).json() == []
+
+    def test_grace_period_protects_fresh_uploads(
+        self, client, auth_headers, db_session, media_dir, monkeypatch
+    ):
+        """Test that a new, not yet attached upload survives a sweep."""
+        import media
+
+        monkeypatch.setattr(media, "MEDIA_GC_GRACE_SECONDS", 3600)
+        url = _upload(client, auth_headers, "a.png", PNG_HEADER + b"new").json()["url"]
+
+        assert media.collect_garbage(db_session) == 0
+        assert media.upload_path(url).exists()
+
+    def test_recount_media_refcounts(self, client, auth_headers, db_session, media_dir):
+        """Test that reference counts can be rebuilt from posts and profiles."""
+        from counters import recount_media_refcounts
+        from models import MediaBlob
+
+        url = _upload(client, auth_headers, "a.png", PNG_HEADER + b"x").json()["url"]
+        client.post(
+            "/api/posts/",
+            json={"content": "Post", "image_url": url},
+            headers=auth_headers,
+        )
+        client.put("/api/users/me", json={"profile_picture": url}, headers=auth_headers)
+        db_session.query(MediaBlob).update({"refcount": 0})
+        db_session.commit()
+
+        recount_media_refcounts(db_session)
+
+        assert db_session.query(MediaBlob).filter_by(url=url).one().refcount == 2
+
+
+def _png(width, height):
+    import io
+
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 40, 40)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.integration
+@pytest.mark.api
+class TestImageDerivatives:
+    """Test background WebP renditions and srcsets."""
+
+    def test_upload_generates_webp_variants(
+        self, client, auth_headers, media_dir, db_session
+    ):
+        """Test that an image upload records resized WebP variants."""
+        from media import upload_path
+        from models import MediaVariant
+
+        url = _upload(client, auth_headers, "big.png", _png(1200, 800)).json()["url"]
+
+        variants = (
+            db_session.query(MediaVariant)
+            .filter_by(source_url=url)
+            .order_by(MediaVariant.width)
+            .all()
+        )
+        assert [variant.width for variant in variants] == [320, 640, 1080]
+        for variant in variants:
+            assert upload_path(variant.url).exists()
+
+    def test_small_image_gets_single_variant(self, tmp_path):
+        """Test that images are never upscaled."""
+        from media import generate_derivatives
+
+        source = tmp_path / "small.png"
+        source.write_bytes(_png(200, 100))
+
+        assert generate_derivatives(str(source), (320, 640)) == [
+            (200, "small.200w.webp")
+        ]
+
+    async def test_dead_worker_replaced(self, tmp_path, monkeypatch):
+        """Test that a killed resize worker does not break later uploads."""
+        import os
+        import signal
+
+        import media
+
+        recorded = []
+        monkeypatch.setattr(media, "MEDIA_WORKERS", 1)
+        monkeypatch.setattr(media, "_executor", None)
+        monkeypatch.setattr(
+            media, "_record_variants", lambda bind, url, variants: recorded.append(url)
+        )
+        source = tmp_path / "photo.png"
+        source.write_bytes(_png(400, 300))
+        try:
+            await media.process_image("/first.png", source, None)
+            for pid in list(media._executor._processes):
+                os.kill(pid, signal.SIGKILL)
+
+            # The task that hit the dead worker is logged and skipped
+            await media.process_image("/second.png", source, None)
+            await media.process_image("/third.png", source, None)
+        finally:
+            media.shutdown()
+
+        assert recorded == ["/first.png", "/third.png"]
+
+    def test_feed_exposes_srcset(self, client, auth_headers, media_dir):
+        """Test that posts with an image expose its srcset."""
+        url = _upload(client, auth_headers, "big.png", _png(700, 400)).json()["url"]
+        client.post(
+            "/api/posts/",
+            json={"content": "Picture", "image_url": url},
+            headers=auth_headers,
+        )
+
+        post = client.get("/api/feed/all", headers=auth_headers).json()[0]
+
+        base = url.rsplit(".", 1)[0]
+        assert post["image_srcset"] == (
+            f"{base}.320w.webp 320w, {base}.640w.webp 640w, {base}.700w.webp 700w"
+        )
+        detail = client.get(f"/api/posts/{post['id']}").json()
+        assert detail["image_srcset"] == post["image_srcset"]
+
+    def test_collected_blob_removes_variants(
+        self, client, auth_headers, media_dir, db_session
+    ):
+        """Test that deleting the last reference removes derivatives too."""
+        from models import MediaVariant
+
+        path = "/api/users/me/upload-avatar"
+        first = _upload(client, auth_headers, "a.png", _png(400, 400), path).json()
+        _upload(client, auth_headers, "b.png", _png(401, 400), path)
+
+        assert (
+            db_session.query(MediaVariant).filter_by(source_url=first["url"]).count()
+            == 0
+        )
+        # new original + its 320w and 400w WebPs
+        assert len(_stored_files(media_dir)) == 3
@@ -7,6 +7,8 @@ block/unblock, and user relationships.
 
 import pytest
 
+from models import User
+
 
 @pytest.mark.integration
 @pytest.mark.api
@@ -39,6 +41,28 @@ class TestGetUserProfile:
         assert "following_count" in data
         assert "posts_count" in data
 
+    def test_unchanged_profile_returns_304(self, client, test_user_2, auth_headers):
+        """Test that If-None-Match with the current ETag returns 304."""
+        url = f"/api/users/{test_user_2.username}"
+        etag = client.get(url, headers=auth_headers).headers["ETag"]
+
+        response = client.get(url, headers={**auth_headers, "If-None-Match": etag})
+
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+
+    def test_follow_changes_profile_etag(self, client, test_user_2, auth_headers):
+        """Test that following the user invalidates the cached profile."""
+        url = f"/api/users/{test_user_2.username}"
+        etag = client.get(url, headers=auth_headers).headers["ETag"]
+        client.post(f"{url}/follow", headers=auth_headers)
+
+        response = client.get(url, headers={**auth_headers, "If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.json()["is_following"] is True
+        assert response.json()["followers_count"] == 1
+
 
 @pytest.mark.integration
 @pytest.mark.api
@@ -257,6 +281,72 @@ class TestGetFollowersFollowing:
         # Should require auth
         assert response.status_code in [401, 403, 422]
 
+    def test_followers_paginated_by_cursor(
+        self, client, test_user, db_session, auth_headers
+    ):
+        """Test walking a followers list page by page with X-Next-Cursor."""
+        fans = [
+            User(
+                email=f"fan{i}@example.com",
+                username=f"fan{i}",
+                display_name=f"Fan {i}",
+                hashed_password="x",
+            )
+            for i in range(5)
+        ]
+        for fan in fans:
+            fan.following.append(test_user)
+        db_session.add_all(fans)
+        db_session.commit()
+
+        url = f"/api/users/{test_user.username}/followers?limit=2"
+        seen, pages = [], 0
+        while url:
+            response = client.get(url, headers=auth_headers)
+            assert response.status_code == 200
+            seen += [user["username"] for user in response.json()]
+            pages += 1
+            cursor = response.headers.get("x-next-cursor")
+            url = cursor and (
+                f"/api/users/{test_user.username}/followers?limit=2&cursor={cursor}"
+            )
+
+        assert sorted(seen) == sorted(fan.username for fan in fans)
+        assert len(seen) == len(set(seen))
+        assert pages == 3
+
+    def test_relationship_flags(
+        self, client, test_user, test_user_2, test_user_3, db_session, auth_headers
+    ):
+        """Test is_following/is_blocked are from the viewer's point of view."""
+        test_user_2.following.append(test_user_3)
+        test_user_2.following.append(test_user)
+        test_user.following.append(test_user_3)
+        test_user.blocking.append(test_user_3)
+        db_session.commit()
+
+        response = client.get(
+            f"/api/users/{test_user_2.username}/following", headers=auth_headers
+        )
+
+        flags = {
+            user["username"]: (user["is_following"], user["is_blocked"])
+            for user in response.json()
+        }
+        assert flags == {
+            test_user.username: (False, False),
+            test_user_3.username: (True, True),
+        }
+
+    def test_invalid_cursor_rejected(self, client, test_user, auth_headers):
+        """Test that a malformed cursor is a 400, not a 500."""
+        response = client.get(
+            f"/api/users/{test_user.username}/followers?cursor=%%%",
+            headers=auth_headers,
+        )
+
+        assert response.status_code == 400
+
 
 @pytest.mark.integration
 @pytest.mark.api
@@ -0,0 +1,149 @@
+"""
+Integration tests for API response compression.
+"""
+
+import gzip
+import zlib
+
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from middleware import CompressionMiddleware
+
+LARGE = [{"id": i, "content": "Feed posts repeat a lot of keys"} for i in range(100)]
+
+
+@pytest.fixture
+def compressed_client():
+    app = FastAPI()
+
+    @app.get("/api/large")
+    def large(response: Response):
+        response.headers["ETag"] = '"v1"'
+        return LARGE
+
+    @app.get("/api/small")
+    def small():
+        return {"ok": True}
+
+    @app.get("/api/image")
+    def image():
+        return Response(b"\x89PNG" + b"\0" * 4096, media_type="image/png")
+
+    @app.get("/api/stream")
+    def stream():
+        async def lines():
+            for i in range(3):
+                yield f"data: {i}\n\n".encode() * 100
+
+        return StreamingResponse(lines(), media_type="text/event-stream")
+
+    @app.get("/outside")
+    def outside():
+        return LARGE
+
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+    return TestClient(app)
+
+
+@pytest.mark.integration
+class TestCompression:
+    """Test gzip/brotli compression of /api responses."""
+
+    def test_large_json_gzipped(self, compressed_client):
+        """Test that large JSON responses are gzipped with Vary set."""
+        response = compressed_client.get(
+            "/api/large", headers={"Accept-Encoding": "gzip"}
+        )
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert int(response.headers["content-length"]) < len(response.content) / 4
+        assert response.json() == LARGE
+
+    def test_strong_etag_weakened(self, compressed_client):
+        """Test that a strong ETag becomes weak once the body is compressed."""
+        response = compressed_client.get(
+            "/api/large", headers={"Accept-Encoding": "gzip"}
+        )
+
+        assert response.headers["etag"] == 'W/"v1"'
+
+    def test_brotli_preferred(self, compressed_client):
+        """Test that brotli wins over gzip when both are accepted."""
+        pytest.importorskip("brotli")
+        response = compressed_client.get(
+            "/api/large", headers={"Accept-Encoding": "gzip, br"}
+        )
+
+        assert response.headers["content-encoding"] == "br"
+        assert response.json() == LARGE
+
+    def test_identity_when_not_accepted(self, compressed_client):
+        """Test that responses stay uncompressed without an accepted encoding."""
+        response = compressed_client.get(
+            "/api/large", headers={"Accept-Encoding": "identity"}
+        )
+
+        assert "content-encoding" not in response.headers
+        assert response.json() == LARGE
+
+    @pytest.mark.parametrize("path", ["/api/small", "/api/image", "/outside"])
+    def test_passed_through(self, compressed_client, path):
+        """Test that small, already-compressed and non-API responses are untouched."""
+        response = compressed_client.get(path, headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+
+    def test_stream_compressed_in_chunks(self, compressed_client):
+        """Test that streaming responses are compressed without a Content-Length."""
+        response = compressed_client.get(
+            "/api/stream", headers={"Accept-Encoding": "gzip"}
+        )
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert response.text == "".join(f"data: {i}\n\n" * 100 for i in range(3))
+
+    async def test_stream_chunks_flushed(self):
+        """Test that each streamed chunk decodes without waiting for the end."""
+
+        async def app(scope, receive, send):
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream")],
+                }
+            )
+            for chunk in (b"data: one\n\n", b"data: two\n\n"):
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+            await send({"type": "http.response.body", "body": b""})
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await CompressionMiddleware(app)(
+            {
+                "type": "http",
+                "method": "GET",
+                "path": "/api/feed/stream",
+                "headers": [(b"accept-encoding", b"gzip")],
+            },
+            None,
+            send,
+        )
+
+        first = messages[1]["body"]
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        assert decoder.decompress(first) == b"data: one\n\n"
+        assert gzip.decompress(b"".join(m.get("body", b"") for m in messages[1:])) == (
+            b"data: one\n\ndata: two\n\n"
+        )
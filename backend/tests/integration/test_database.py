@@ -9,6 +9,7 @@ import pytest
 from sqlalchemy.exc import IntegrityError
 
 from auth import get_password_hash
+from blocking import blocked_ids_cache, blocked_user_ids
 from models import Comment, Post, Reaction, User
 
 
@@ -77,6 +78,34 @@ class TestDatabaseConstraints:
             # If it fails, foreign keys are enforced (good!)
             pass
 
+    def test_one_reaction_per_user_per_post(self, db_session, test_reaction):
+        """Test that the (post_id, user_id) unique constraint is enforced."""
+        duplicate = Reaction(
+            post_id=test_reaction.post_id,
+            user_id=test_reaction.user_id,
+            reaction_type="love",
+        )
+        db_session.add(duplicate)
+
+        with pytest.raises(IntegrityError):
+            db_session.commit()
+
+    def test_feed_queries_use_indexes(self, db_session, test_user):
+        """Test that feed-shaped queries are index seeks, not table scans."""
+        from sqlalchemy import text
+
+        plan = db_session.execute(
+            text(
+                "EXPLAIN QUERY PLAN SELECT id FROM posts WHERE author_id = :author "
+                "ORDER BY created_at DESC, id DESC LIMIT 50"
+            ),
+            {"author": test_user.id},
+        ).all()
+        details = " ".join(row[3] for row in plan)
+
+        assert "ix_posts_author_id_created_at_id" in details
+        assert "TEMP B-TREE" not in details
+
 
 @pytest.mark.database
 class TestDatabaseCRUD:
@@ -350,6 +379,431 @@ class TestCascadeOperations:
         assert reaction is None
 
 
+@pytest.mark.database
+class TestPostCounters:
+    """Test denormalized counters on posts."""
+
+    def test_counters_follow_inserts_and_deletes(
+        self, db_session, test_post, test_user_2
+    ):
+        """Test that comment, reaction and repost writes update the counters."""
+        comment = Comment(post_id=test_post.id, author_id=test_user_2.id, content="Hi")
+        reaction = Reaction(
+            post_id=test_post.id, user_id=test_user_2.id, reaction_type="like"
+        )
+        repost = Post(
+            author_id=test_user_2.id,
+            content="",
+            is_repost=True,
+            original_post_id=test_post.id,
+        )
+        db_session.add_all([comment, reaction, repost])
+        db_session.commit()
+
+        assert test_post.comments_count == 1
+        assert test_post.reactions_count == 1
+        assert test_post.reposts_count == 1
+
+        db_session.delete(comment)
+        db_session.delete(reaction)
+        db_session.delete(repost)
+        db_session.commit()
+
+        assert test_post.comments_count == 0
+        assert test_post.reactions_count == 0
+        assert test_post.reposts_count == 0
+
+    def test_recount_repairs_drifted_counters(
+        self, db_session, test_post, test_comment, test_reaction
+    ):
+        """Test that the repair command recomputes counters from source tables."""
+        from counters import recount_post_counters
+
+        test_post.comments_count = 42
+        test_post.reactions_count = -3
+        test_post.reposts_count = 7
+        db_session.commit()
+
+        updated = recount_post_counters(db_session)
+
+        assert updated == 1
+        assert test_post.comments_count == 1
+        assert test_post.reactions_count == 1
+        assert test_post.reposts_count == 0
+
+
+@pytest.mark.database
+class TestUserCounters:
+    """Test denormalized follow and post counters on users."""
+
+    def test_counters_follow_writes(
+        self, db_session, test_user, test_user_2, test_user_3
+    ):
+        """Test that follows, blocks and posts update both users' counters."""
+        test_user.following.append(test_user_2)
+        test_user_3.following.append(test_user_2)
+        db_session.add(Post(author_id=test_user_2.id, content="Counted"))
+        db_session.commit()
+
+        assert test_user.following_count == 1
+        assert test_user_2.followers_count == 2
+        assert test_user_2.posts_count == 1
+
+        # Blocking removes the follow in the same flush
+        test_user.following.remove(test_user_2)
+        test_user.blocking.append(test_user_2)
+        db_session.commit()
+
+        assert test_user.following_count == 0
+        assert test_user_2.followers_count == 1
+
+    def test_deleted_user_releases_counts(
+        self, db_session, test_user, test_user_2, test_user_3
+    ):
+        """Test that deleting an account updates the users it was linked to."""
+        test_user.following.append(test_user_2)
+        test_user_3.following.append(test_user)
+        db_session.commit()
+
+        db_session.delete(test_user)
+        db_session.commit()
+
+        assert test_user_2.followers_count == 0
+        assert test_user_3.following_count == 0
+
+    def test_recount_repairs_drifted_counters(
+        self, db_session, test_user, test_user_2, test_post
+    ):
+        """Test that the repair command recomputes user counters."""
+        from counters import recount_user_counters
+
+        test_user_2.following.append(test_user)
+        db_session.commit()
+        test_user.followers_count = 9
+        test_user.posts_count = 0
+        test_user_2.following_count = -1
+        db_session.commit()
+
+        recount_user_counters(db_session)
+
+        assert test_user.followers_count == 1
+        assert test_user.posts_count == 1
+        assert test_user_2.following_count == 1
+
+
+@pytest.mark.database
+class TestRelationshipWrites:
+    """Test direct follow/block edge writes in relationships.py."""
+
+    def test_follow_is_idempotent(self, db_session, test_user, test_user_2, test_posts):
+        """Test that only the first follow changes a row and its side effects."""
+        import relationships
+        from models import TimelineEntry
+
+        assert relationships.follow(db_session, test_user.id, test_user_2.id)
+        assert not relationships.follow(db_session, test_user.id, test_user_2.id)
+        db_session.commit()
+
+        assert test_user_2 in test_user.following
+        assert test_user.following_count == 1
+        assert test_user_2.followers_count == 1
+        assert db_session.query(TimelineEntry).filter_by(user_id=test_user.id).count()
+
+        assert relationships.unfollow(db_session, test_user.id, test_user_2.id)
+        assert not relationships.unfollow(db_session, test_user.id, test_user_2.id)
+        db_session.commit()
+
+        assert test_user.following == []
+        assert test_user_2.followers_count == 0
+        assert (
+            not db_session.query(TimelineEntry).filter_by(user_id=test_user.id).count()
+        )
+
+    def test_block_drops_follows_both_ways(self, db_session, test_user, test_user_2):
+        """Test that a block removes mutual follows and invalidates block caches."""
+        import relationships
+
+        relationships.follow(db_session, test_user.id, test_user_2.id)
+        relationships.follow(db_session, test_user_2.id, test_user.id)
+        db_session.commit()
+        assert blocked_user_ids(db_session, test_user_2.id) == frozenset()
+
+        assert relationships.block(db_session, test_user.id, test_user_2.id)
+        assert not relationships.block(db_session, test_user.id, test_user_2.id)
+        db_session.commit()
+
+        assert test_user.following_count == test_user.followers_count == 0
+        assert test_user_2.following == []
+        assert blocked_user_ids(db_session, test_user_2.id) == {test_user.id}
+
+        assert relationships.unblock(db_session, test_user.id, test_user_2.id)
+        db_session.commit()
+
+        assert blocked_user_ids(db_session, test_user_2.id) == frozenset()
+
+
+@pytest.mark.database
+class TestHomeTimeline:
+    """Test the materialized home timeline."""
+
+    def test_rebuild_timelines_matches_follow_graph(
+        self, db_session, test_user, test_user_2, test_posts
+    ):
+        """Test that rebuilding restores entries for every followed post."""
+        from counters import rebuild_timelines
+        from models import TimelineEntry
+
+        test_user.following.append(test_user_2)
+        db_session.commit()
+        expected = {
+            (entry.user_id, entry.post_id)
+            for entry in db_session.query(TimelineEntry).all()
+        }
+        assert len(expected) == 2
+
+        db_session.query(TimelineEntry).delete()
+        db_session.commit()
+
+        assert rebuild_timelines(db_session) == 1
+        rebuilt = {
+            (entry.user_id, entry.post_id)
+            for entry in db_session.query(TimelineEntry).all()
+        }
+        assert rebuilt == expected
+
+    def test_deleting_post_removes_timeline_entries(
+        self, db_session, test_user, test_user_2, test_posts
+    ):
+        """Test that deleted posts disappear from followers' timelines."""
+        from models import TimelineEntry
+
+        test_user.following.append(test_user_2)
+        db_session.commit()
+
+        for post in test_posts:
+            if post.author_id == test_user_2.id:
+                db_session.delete(post)
+        db_session.commit()
+
+        assert db_session.query(TimelineEntry).count() == 0
+
+
+@pytest.mark.database
+class TestBlockedIdsCache:
+    """Test the versioned blocked-user set cache."""
+
+    def test_includes_both_directions(
+        self, db_session, test_user, test_user_2, test_user_3
+    ):
+        """Test that the set covers users blocked by and blocking the viewer."""
+        test_user.blocking.append(test_user_2)
+        test_user_3.blocking.append(test_user)
+        db_session.commit()
+
+        assert blocked_user_ids(db_session, test_user.id) == {
+            test_user_2.id,
+            test_user_3.id,
+        }
+        assert blocked_user_ids(db_session, test_user_2.id) == {test_user.id}
+
+    def test_cached_until_blocks_change(self, db_session, test_user, test_user_2):
+        """Test that a block bumps the version and invalidates the cached set."""
+        assert blocked_user_ids(db_session, test_user.id) == frozenset()
+        hits = blocked_ids_cache.hits
+        assert blocked_user_ids(db_session, test_user.id) == frozenset()
+        assert blocked_ids_cache.hits == hits + 1
+
+        test_user_2.blocking.append(test_user)
+        db_session.commit()
+
+        assert blocked_user_ids(db_session, test_user.id) == {test_user_2.id}
+        test_user_2.blocking.remove(test_user)
+        db_session.commit()
+        assert blocked_user_ids(db_session, test_user.id) == frozenset()
+
+
+@pytest.mark.database
+class TestEngineProfile:
+    """Test the SQLite engine profile and pool statistics."""
+
+    def test_sqlite_pragmas_enable_wal(self, tmp_path):
+        """Test that the production profile switches SQLite to WAL mode."""
+        import sqlite3
+
+        from database import apply_sqlite_pragmas
+
+        connection = sqlite3.connect(tmp_path / "profile.db")
+        try:
+            apply_sqlite_pragmas(connection)
+            journal_mode = connection.execute("PRAGMA journal_mode").fetchone()[0]
+            busy_timeout = connection.execute("PRAGMA busy_timeout").fetchone()[0]
+            synchronous = connection.execute("PRAGMA synchronous").fetchone()[0]
+        finally:
+            connection.close()
+
+        assert journal_mode == "wal"
+        assert busy_timeout == 5000
+        assert synchronous == 1  # NORMAL
+
+    def test_pool_stats_reports_usage(self, db_session):
+        """Test that pool statistics reflect checked-out connections."""
+        from database import pool_stats
+        from tests.conftest import test_engine
+
+        db_session.connection()
+        stats = pool_stats(test_engine)
+
+        assert stats["checkedout"] >= 1
+        assert "status" in stats
+
+    def test_metrics_endpoint_exposes_pool(self, client, monkeypatch):
+        """Test that /api/metrics includes pool statistics."""
+        monkeypatch.setenv("METRICS_TOKEN", "metrics-secret")
+        response = client.get(
+            "/api/metrics", headers={"Authorization": "Bearer metrics-secret"}
+        )
+
+        assert response.status_code == 200
+        assert "db_pool" in response.json()
+        assert "user_cache" in response.json()
+
+    def test_metrics_endpoint_requires_token(self, client, auth_headers, monkeypatch):
+        """Test that /api/metrics is refused without the metrics token."""
+        monkeypatch.delenv("TESTING", raising=False)
+        monkeypatch.setenv("METRICS_TOKEN", "metrics-secret")
+
+        assert client.get("/api/metrics").status_code == 403
+        assert client.get("/api/metrics", headers=auth_headers).status_code == 403
+
+
+def _request(method, token=None):
+    from starlette.requests import Request
+
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return Request(
+        {
+            "type": "http",
+            "method": method,
+            "path": "/",
+            "headers": headers,
+            "client": ("203.0.113.7", 1234),
+        }
+    )
+
+
+@pytest.fixture
+def replica_setup(tmp_path):
+    """Primary and replica SQLite files holding different users"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from cache import TTLCache
+    from database import Base, RoutingSession
+
+    engines = {}
+    for name in ("primary", "replica"):
+        engines[name] = create_engine(f"sqlite:///{tmp_path / name}.db")
+        Base.metadata.create_all(bind=engines[name])
+        with sessionmaker(bind=engines[name])() as session:
+            session.add(
+                User(
+                    email=f"{name}@example.com",
+                    username=f"{name}_user",
+                    display_name=name,
+                    hashed_password="x",
+                )
+            )
+            session.commit()
+
+    factory = sessionmaker(bind=engines["primary"], class_=RoutingSession)
+    yield factory, [engines["replica"]], TTLCache(ttl=60)
+    for bound in engines.values():
+        bound.dispose()
+
+
+@pytest.mark.database
+class TestReadReplicaRouting:
+    """Test routing of read-only requests to replicas."""
+
+    def _usernames(self, session):
+        return {user.username for user in session.query(User).all()}
+
+    def test_get_reads_from_replica(self, replica_setup):
+        """Test that GET requests read from a replica."""
+        from database import route_session
+
+        factory, replicas, writers = replica_setup
+        with factory() as session:
+            route_session(session, _request("GET", "token"), replicas, writers)
+            assert self._usernames(session) == {"replica_user"}
+
+    def test_writes_go_to_primary(self, replica_setup):
+        """Test that POST requests read and write on the primary."""
+        from database import route_session
+
+        factory, replicas, writers = replica_setup
+        with factory() as session:
+            route_session(session, _request("POST", "token"), replicas, writers)
+            assert self._usernames(session) == {"primary_user"}
+
+    def test_read_your_writes(self, replica_setup):
+        """Test that a writer's next GET stays on the primary, others don't."""
+        from database import route_session
+
+        factory, replicas, writers = replica_setup
+        with factory() as session:
+            route_session(session, _request("POST", "writer"), replicas, writers)
+            session.add(
+                User(
+                    email="new@example.com",
+                    username="new_user",
+                    display_name="New",
+                    hashed_password="x",
+                )
+            )
+            session.commit()
+
+        with factory() as session:
+            route_session(session, _request("GET", "writer"), replicas, writers)
+            assert "new_user" in self._usernames(session)
+
+        with factory() as session:
+            route_session(session, _request("GET", "someone-else"), replicas, writers)
+            assert self._usernames(session) == {"replica_user"}
+
+    def test_anonymous_write_sticks_by_address(self, replica_setup):
+        """Test that a registration keeps the following login on the primary."""
+        from database import route_session
+
+        factory, replicas, writers = replica_setup
+        with factory() as session:
+            route_session(session, _request("POST"), replicas, writers)
+            session.add(
+                User(
+                    email="signup@example.com",
+                    username="signup_user",
+                    display_name="Signup",
+                    hashed_password="x",
+                )
+            )
+            session.commit()
+
+        with factory() as session:
+            route_session(session, _request("GET", "fresh-token"), replicas, writers)
+            assert "signup_user" in self._usernames(session)
+
+    def test_get_db_without_replicas_uses_primary(self):
+        """Test that get_db keeps GETs on the primary when none are configured."""
+        from database import engine, get_db
+
+        generator = get_db(_request("GET"))
+        session = next(generator)
+        try:
+            assert session.get_bind() is engine
+        finally:
+            generator.close()
+
+
 @pytest.mark.database
 class TestDatabasePerformance:
     """Test database performance characteristics."""
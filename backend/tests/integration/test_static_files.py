@@ -0,0 +1,254 @@
+"""
+Integration tests for the /static media server and the frontend build.
+"""
+
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from precompress import precompress
+from static_files import FrontendStaticFiles, MediaStaticFiles, accepted_encodings
+
+DIGEST = "ab12" + "0" * 28
+CONTENT = bytes(range(256)) * 4
+SCRIPT = b"console.log('testbook');\n" * 200
+ASSET = "/assets/index-Bx3kQ9aZ.js"
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    (tmp_path / "videos").mkdir()
+    (tmp_path / "videos" / "clip.mp4").write_bytes(CONTENT)
+    blob_dir = tmp_path / "uploads" / "ab" / "12"
+    blob_dir.mkdir(parents=True)
+    (blob_dir / f"{DIGEST}.png").write_bytes(CONTENT)
+    return tmp_path
+
+
+@pytest.fixture
+def static_client(static_dir):
+    app = FastAPI()
+    app.mount("/static", MediaStaticFiles(directory=static_dir), name="static")
+    return TestClient(app)
+
+
+@pytest.mark.integration
+class TestStaticMedia:
+    """Test ranges, ETags and cache headers on static files."""
+
+    def test_full_response_headers(self, static_client):
+        """Test that a full response advertises ranges, caching and a strong ETag."""
+        response = static_client.get("/static/videos/clip.mp4")
+
+        assert response.status_code == 200
+        assert response.content == CONTENT
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["cache-control"] == "public, max-age=3600"
+        assert not response.headers["etag"].startswith("W/")
+
+    def test_byte_range(self, static_client):
+        """Test that a byte range is served as 206 with a Content-Range."""
+        response = static_client.get(
+            "/static/videos/clip.mp4", headers={"Range": "bytes=10-19"}
+        )
+
+        assert response.status_code == 206
+        assert response.content == CONTENT[10:20]
+        assert response.headers["content-range"] == f"bytes 10-19/{len(CONTENT)}"
+        assert response.headers["content-length"] == "10"
+
+    @pytest.mark.parametrize(
+        "header,expected",
+        [("bytes=1000-", CONTENT[1000:]), ("bytes=-24", CONTENT[-24:])],
+    )
+    def test_open_and_suffix_ranges(self, static_client, header, expected):
+        """Test that open-ended and suffix ranges return the right bytes."""
+        response = static_client.get(
+            "/static/videos/clip.mp4", headers={"Range": header}
+        )
+
+        assert response.status_code == 206
+        assert response.content == expected
+
+    def test_unsatisfiable_range(self, static_client):
+        """Test that a range past the end of the file returns 416."""
+        response = static_client.get(
+            "/static/videos/clip.mp4", headers={"Range": "bytes=5000-"}
+        )
+
+        assert response.status_code == 416
+        assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+    def test_stale_if_range_returns_full_file(self, static_client):
+        """Test that a stale If-Range validator returns the whole file."""
+        response = static_client.get(
+            "/static/videos/clip.mp4",
+            headers={"Range": "bytes=0-9", "If-Range": '"stale"'},
+        )
+
+        assert response.status_code == 200
+        assert response.content == CONTENT
+
+    def test_if_none_match_returns_304(self, static_client):
+        """Test that a matching If-None-Match returns 304."""
+        etag = static_client.get("/static/videos/clip.mp4").headers["etag"]
+
+        response = static_client.get(
+            "/static/videos/clip.mp4", headers={"If-None-Match": etag}
+        )
+
+        assert response.status_code == 304
+
+    def test_content_addressed_upload_is_immutable(self, static_client):
+        """Test that hashed uploads use their digest as ETag and are immutable."""
+        response = static_client.get(f"/static/uploads/ab/12/{DIGEST}.png")
+
+        assert response.headers["etag"] == f'"{DIGEST}"'
+        assert "immutable" in response.headers["cache-control"]
+
+    def test_head_sends_no_body(self, static_client):
+        """Test that HEAD returns the headers without a body."""
+        response = static_client.head("/static/videos/clip.mp4")
+
+        assert response.status_code == 200
+        assert response.content == b""
+        assert response.headers["content-length"] == str(len(CONTENT))
+
+    async def test_zero_copy_send_when_supported(self, static_dir):
+        """Test that servers offering zerocopysend get the file, not its bytes."""
+        static = MediaStaticFiles(directory=static_dir)
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        await static(
+            {
+                "type": "http",
+                "method": "GET",
+                "path": "/videos/clip.mp4",
+                "root_path": "",
+                "headers": [(b"range", b"bytes=100-199")],
+                "query_string": b"",
+                "extensions": {"http.response.zerocopysend": {}},
+            },
+            receive,
+            send,
+        )
+
+        assert messages[0]["status"] == 206
+        assert messages[1]["type"] == "http.response.zerocopysend"
+        assert (messages[1]["offset"], messages[1]["count"]) == (100, 100)
+
+
+@pytest.fixture
+def frontend_client(tmp_path):
+    (tmp_path / "assets").mkdir()
+    (tmp_path / "assets" / "index-Bx3kQ9aZ.js").write_bytes(SCRIPT)
+    (tmp_path / "index.html").write_bytes(b"<!doctype html>" + b"<div></div>" * 100)
+    (tmp_path / "favicon.svg").write_bytes(b"<svg/>")
+    precompress(tmp_path)
+    app = FastAPI()
+    app.mount("/", FrontendStaticFiles(directory=tmp_path, html=True), name="frontend")
+    return TestClient(app)
+
+
+@pytest.mark.integration
+class TestFrontendAssets:
+    """Test precompressed frontend assets and their cache headers."""
+
+    def test_gzip_sibling_served(self, frontend_client):
+        """Test that the .gz sibling is served to gzip clients."""
+        response = frontend_client.get(ASSET, headers={"Accept-Encoding": "gzip"})
+
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert "javascript" in response.headers["content-type"]
+        assert response.content == SCRIPT
+        assert int(response.headers["content-length"]) < len(SCRIPT)
+
+    def test_brotli_preferred(self, frontend_client):
+        """Test that the .br sibling wins when brotli is accepted."""
+        pytest.importorskip("brotli")
+        response = frontend_client.get(
+            ASSET, headers={"Accept-Encoding": "gzip, deflate, br"}
+        )
+
+        assert response.headers["content-encoding"] == "br"
+        assert response.content == SCRIPT
+
+    def test_identity_without_accept_encoding(self, frontend_client):
+        """Test that the plain file is served without an accepted encoding."""
+        response = frontend_client.get(ASSET, headers={"Accept-Encoding": "identity"})
+
+        assert "content-encoding" not in response.headers
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.content == SCRIPT
+
+    def test_hashed_asset_is_immutable(self, frontend_client):
+        """Test that fingerprinted build assets are cached as immutable."""
+        response = frontend_client.get(ASSET)
+
+        assert "immutable" in response.headers["cache-control"]
+
+    def test_index_html_revalidated(self, frontend_client):
+        """Test that index.html is revalidated on every load."""
+        response = frontend_client.get("/", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["cache-control"] == "no-cache"
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.content.startswith(b"<!doctype html>")
+
+    def test_small_file_not_precompressed(self, frontend_client):
+        """Test that files below the size threshold are not precompressed."""
+        response = frontend_client.get(
+            "/favicon.svg", headers={"Accept-Encoding": "gzip"}
+        )
+
+        assert "content-encoding" not in response.headers
+        assert response.headers["cache-control"] == "public, max-age=3600"
+
+    def test_encoded_etag_differs(self, frontend_client):
+        """Test that each encoding has its own ETag that still revalidates."""
+        encoded = frontend_client.get(ASSET, headers={"Accept-Encoding": "gzip"})
+        plain = frontend_client.get(ASSET, headers={"Accept-Encoding": "identity"})
+
+        assert encoded.headers["etag"] != plain.headers["etag"]
+        revalidated = frontend_client.get(
+            ASSET,
+            headers={
+                "Accept-Encoding": "gzip",
+                "If-None-Match": encoded.headers["etag"],
+            },
+        )
+        assert revalidated.status_code == 304
+
+    def test_precompress_is_deterministic(self, tmp_path):
+        """Test that precompressing twice writes identical bytes."""
+        (tmp_path / "app.css").write_bytes(SCRIPT)
+        precompress(tmp_path)
+        first = (tmp_path / "app.css.gz").read_bytes()
+        precompress(tmp_path)
+
+        assert (tmp_path / "app.css.gz").read_bytes() == first
+        assert gzip.decompress(first) == SCRIPT
+
+    @pytest.mark.parametrize(
+        "header,expected",
+        [
+            ("gzip, br;q=0.5", {"gzip", "br"}),
+            ("br;q=0, gzip", {"gzip"}),
+            ("*", {"br", "gzip"}),
+            ("*, br;q=0", {"gzip"}),
+            ("", set()),
+        ],
+    )
+    def test_accepted_encodings(self, header, expected):
+        """Test that Accept-Encoding is parsed with q-values and wildcards."""
+        assert accepted_encodings(header) == expected
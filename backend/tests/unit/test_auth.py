@@ -15,18 +15,25 @@ This file is referenced in Stage 1 learning materials as an example
 of professional unit testing practices.
 """
 
+import asyncio
+import os
+import signal
+import time
 from datetime import datetime, timedelta, timezone
 
 import pytest
+from fastapi import HTTPException
 from jose import JWTError, jwt
 
 from auth import (
     ALGORITHM,
     SECRET_KEY,
+    PasswordHasherPool,
     create_access_token,
     get_password_hash,
     verify_password,
 )
+from cache import TTLCache
 
 
 @pytest.mark.unit
@@ -308,6 +315,76 @@ class TestTokenDataStructure:
         assert time_diff.total_seconds() > 0  # Should be in future
 
 
+@pytest.mark.unit
+class TestUserCache:
+    """Test cached user resolution in get_current_user."""
+
+    def test_cache_evicts_least_recently_used(self):
+        """Test that the cache stays within maxsize."""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.stats()["evictions"] == 1
+
+    def test_cache_entries_expire(self):
+        """Test that entries are dropped after the TTL."""
+        cache = TTLCache(maxsize=2, ttl=0)
+        cache.set("a", 1)
+
+        assert cache.get("a") is None
+        assert cache.stats()["misses"] == 1
+
+    def test_second_lookup_skips_database(self, test_user):
+        """Test that a cached user is resolved without a query."""
+        from fastapi.security import HTTPAuthorizationCredentials
+        from sqlalchemy import event
+
+        from auth import get_current_user, user_cache
+        from tests.conftest import TestingSessionLocal, test_engine
+
+        token = create_access_token(data={"sub": test_user.email})
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+        first_session = TestingSessionLocal()
+        get_current_user(credentials, first_session)
+        first_session.close()
+
+        statements = []
+
+        def before_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        second_session = TestingSessionLocal()
+        event.listen(test_engine, "before_cursor_execute", before_execute)
+        try:
+            user = get_current_user(credentials, second_session)
+            assert user.id == test_user.id
+            assert user.username == test_user.username
+        finally:
+            event.remove(test_engine, "before_cursor_execute", before_execute)
+            second_session.close()
+
+        assert statements == []
+        assert user_cache.stats()["hits"] == 1
+        assert user_cache.stats()["misses"] == 1
+
+    def test_profile_update_invalidates_cache(self, client, test_user, auth_headers):
+        """Test that updating the profile drops the cached entry."""
+        from auth import user_cache
+
+        client.get("/api/auth/me", headers=auth_headers)
+        assert user_cache.stats()["size"] == 1
+
+        client.put("/api/users/me", json={"bio": "New bio"}, headers=auth_headers)
+
+        assert user_cache.get(test_user.email) is None
+
+
 # 🧠 Why These Tests Matter:
 #
 # Unit tests for authentication are CRITICAL because:
@@ -328,3 +405,47 @@ class TestTokenDataStructure:
 # - These demonstrate you understand cryptography basics (hashing, tokens)
 # - Interview question: "How would you test authentication?" - You can point to these!
 # - Shows you think about edge cases (unicode, empty passwords, timing)
+
+
+@pytest.mark.unit
+class TestPasswordHasherPool:
+    """Test back-pressure in the bcrypt process pool."""
+
+    async def test_cancelled_request_keeps_slot_until_job_ends(self):
+        """Test that a cancelled caller does not free capacity while bcrypt runs."""
+        pool = PasswordHasherPool(max_workers=1, max_pending=1)
+        try:
+            # Start the worker so the job below begins running right away
+            await pool.run(time.sleep, 0)
+            waiter = asyncio.create_task(pool.run(time.sleep, 0.5))
+            await asyncio.sleep(0.1)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+
+            with pytest.raises(HTTPException) as busy:
+                await pool.run(time.sleep, 0)
+            assert busy.value.status_code == 503
+
+            await asyncio.sleep(0.8)
+            assert pool._pending == 0
+            await pool.run(time.sleep, 0)
+        finally:
+            pool.shutdown()
+
+    async def test_dead_worker_replaced(self):
+        """Test that a killed bcrypt worker costs a 503, not every later login."""
+        pool = PasswordHasherPool(max_workers=1, max_pending=4)
+        try:
+            await pool.run(time.sleep, 0)
+            for pid in list(pool._executor._processes):
+                os.kill(pid, signal.SIGKILL)
+
+            with pytest.raises(HTTPException) as busy:
+                await pool.run(time.sleep, 0.2)
+            assert busy.value.status_code == 503
+
+            await pool.run(time.sleep, 0)
+            assert pool._pending == 0
+        finally:
+            pool.shutdown()
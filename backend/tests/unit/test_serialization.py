@@ -0,0 +1,54 @@
+"""
+Unit tests for the trusted JSON response path.
+"""
+
+import json
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+
+import schemas
+from serialization import model_response
+
+
+def _post(post_id: int, **extra) -> schemas.PostResponse:
+    return schemas.PostResponse(
+        id=post_id,
+        content="Café \U0001f600",
+        author_id=1,
+        author_username="sarahjohnson",
+        author_display_name="Sarah Johnson",
+        author_profile_picture="/static/images/avatar.jpg",
+        created_at=datetime(2025, 1, 2, 3, 4, 5, 678000, tzinfo=timezone.utc),
+        **extra,
+    )
+
+
+@pytest.mark.unit
+class TestModelResponse:
+    """Test that model_response matches FastAPI's default serialization."""
+
+    def test_matches_default_encoding(self):
+        """Test that the body matches jsonable_encoder output."""
+        page = [_post(2, is_repost=True, original_post_id=1, original_post=_post(1))]
+
+        response = model_response(page)
+
+        assert json.loads(response.body) == jsonable_encoder(page)
+        assert response.headers["content-type"] == "application/json"
+
+    def test_carries_over_injected_response(self):
+        """Test that status and headers set on the injected response are kept."""
+        injected = Response()
+        del injected.headers["content-length"]
+        injected.headers["X-Next-Cursor"] = "abc"
+        injected.status_code = 203
+
+        response = model_response([], injected)
+
+        assert response.body == b"[]"
+        assert response.status_code == 203
+        assert response.headers["x-next-cursor"] == "abc"
+        assert response.headers["content-length"] == "2"
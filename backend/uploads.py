@@ -0,0 +1,123 @@
+"""
+Streaming, content-addressed upload storage.
+
+Uploads are copied to disk in ``CHUNK_SIZE`` pieces, so memory use per upload
+stays constant regardless of file size. File I/O runs in the threadpool so a
+slow disk never stalls the event loop. Data goes to a temporary file and is
+renamed into place once complete, so a partial upload is never visible under
+its final name.
+
+Files are named after the BLAKE2b digest of their content and sharded into
+``ab/cd/`` subdirectories, so uploading the same bytes twice stores them once.
+"""
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import NamedTuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+CHUNK_SIZE = 64 * 1024
+DIGEST_SIZE = 16  # bytes; 32 hex characters
+
+
+class StoredUpload(NamedTuple):
+    digest: str
+    path: Path
+    size: int
+    # False when identical content was already stored
+    created: bool
+
+
+def blob_path(directory: Path, digest: str, extension: str) -> Path:
+    """Sharded location of a blob: ``directory/ab/cd/abcd....ext``"""
+    return directory / digest[:2] / digest[2:4] / f"{digest}{extension}"
+
+
+def _is_riff(head: bytes, form: bytes) -> bool:
+    return head[:4] == b"RIFF" and head[8:12] == form
+
+
+def _is_iso_media(head: bytes) -> bool:
+    # MP4/MOV: a box size followed by the "ftyp" (or legacy QuickTime) box type
+    return head[4:8] in (b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip")
+
+
+# File signatures ("magic bytes") expected at the start of each allowed type
+MAGIC_CHECKS = {
+    ".jpg": lambda head: head.startswith(b"\xff\xd8\xff"),
+    ".jpeg": lambda head: head.startswith(b"\xff\xd8\xff"),
+    ".png": lambda head: head.startswith(b"\x89PNG\r\n\x1a\n"),
+    ".gif": lambda head: head[:6] in (b"GIF87a", b"GIF89a"),
+    ".webp": lambda head: _is_riff(head, b"WEBP"),
+    ".mp4": _is_iso_media,
+    ".mov": _is_iso_media,
+    ".avi": lambda head: _is_riff(head, b"AVI "),
+}
+
+
+def matches_extension(extension: str, head: bytes) -> bool:
+    """Whether ``head`` starts with the signature for ``extension``"""
+    check = MAGIC_CHECKS.get(extension)
+    return check is not None and check(head)
+
+
+def _open_temp(directory: Path):
+    return tempfile.NamedTemporaryFile(dir=directory, suffix=".part", delete=False)
+
+
+def _discard(handle) -> None:
+    handle.close()
+    try:
+        os.unlink(handle.name)
+    except FileNotFoundError:
+        pass
+
+
+def _place(temp_name: str, destination: Path) -> bool:
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    if destination.exists():
+        os.unlink(temp_name)
+        return False
+    os.replace(temp_name, destination)
+    return True
+
+
+async def save_upload(
+    file: UploadFile, directory: Path, extension: str
+) -> StoredUpload:
+    """
+    Stream ``file`` into the content-addressed store under ``directory``.
+
+    The content of the first chunk must match ``extension``, otherwise a 400
+    is raised and nothing is written. If the same content is already stored,
+    the new copy is discarded and the existing path returned.
+    """
+    first_chunk = await file.read(CHUNK_SIZE)
+    if not matches_extension(extension, first_chunk):
+        raise HTTPException(
+            status_code=400, detail="File content does not match its type"
+        )
+
+    await run_in_threadpool(directory.mkdir, parents=True, exist_ok=True)
+    handle = await run_in_threadpool(_open_temp, directory)
+    hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    size = 0
+    try:
+        chunk = first_chunk
+        while chunk:
+            hasher.update(chunk)
+            await run_in_threadpool(handle.write, chunk)
+            size += len(chunk)
+            chunk = await file.read(CHUNK_SIZE)
+        await run_in_threadpool(handle.close)
+        digest = hasher.hexdigest()
+        destination = blob_path(directory, digest, extension)
+        created = await run_in_threadpool(_place, handle.name, destination)
+    except BaseException:
+        await run_in_threadpool(_discard, handle)
+        raise
+    return StoredUpload(digest, destination, size, created)
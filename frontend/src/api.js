@@ -22,6 +22,19 @@ api.interceptors.request.use(
   (error) => Promise.reject(error)
 );
 
+// Fetch every page of a cursor-paginated list (the API returns up to `limit`
+// items per request and an X-Next-Cursor header while more remain)
+const getAllPages = async (url, limit = 100) => {
+  const items = [];
+  let cursor;
+  do {
+    const response = await api.get(url, { params: { limit, cursor } });
+    items.push(...response.data);
+    cursor = response.headers['x-next-cursor'];
+  } while (cursor);
+  return { data: items };
+};
+
 // Auth API
 export const authAPI = {
   login: (email, password) => api.post('/auth/login', { email, password }),
@@ -50,8 +63,8 @@ export const usersAPI = {
   unblockUser: (username) => api.delete(`/users/${username}/block`),
   getUserPosts: (username, skip = 0, limit = 50) =>
     api.get(`/users/${username}/posts?skip=${skip}&limit=${limit}`),
-  getFollowers: (username) => api.get(`/users/${username}/followers`),
-  getFollowing: (username) => api.get(`/users/${username}/following`),
+  getFollowers: (username) => getAllPages(`/users/${username}/followers`),
+  getFollowing: (username) => getAllPages(`/users/${username}/following`),
 };
 
 // Posts API
@@ -283,6 +283,8 @@ function Post({ post, onDelete, onUpdate, detailed = false }) {
       {post.image_url && (
         <img
           src={post.image_url}
+          srcSet={post.image_srcset || undefined}
+          sizes="(max-width: 700px) 100vw, 700px"
           alt="Post content"
           className={`post-media post-media-${imageOrientation}`}
           onLoad={handleImageLoad}
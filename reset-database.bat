@@ -33,6 +33,10 @@ if not errorlevel 1 (
                 del /Q "%%F"
             )
         )
+        REM Content-addressed shard directories (ab\cd\...)
+        for /D %%D in (backend\static\uploads\*) do (
+            if not "%%~nxD"=="avatars" rmdir /S /Q "%%D"
+        )
         echo    Cleaned uploaded files
     )
 
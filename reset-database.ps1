@@ -35,7 +35,7 @@ if ($backendRunning) {
 
     # Delete uploaded files (posts and avatars)
     if (Test-Path "backend\static\uploads") {
-        Get-ChildItem "backend\static\uploads" -File | Where-Object {
+        Get-ChildItem "backend\static\uploads" -File -Recurse | Where-Object {
             $_.Name -ne ".gitignore" -and $_.Name -ne ".gitkeep"
         } | Remove-Item -Force
         Write-Host "   Cleaned uploaded files"